@@ -291,6 +291,16 @@ class Atom:
         """ copy atom"""
         return copy.deepcopy(self)
 
+    def clone(self):
+        """ copy atom without deep-copying the molecule it
+        belongs to. List attributes (coordinates, bonds, ...)
+        are copied, the atoms in them are shared."""
+        new = copy.copy(self)
+        for key, val in self.__dict__.items():
+            if isinstance(val, list):
+                new.__dict__[key] = val[:]
+        return new
+
     def get_symbol(self):
         """ get element"""
         if self.long_name == '':
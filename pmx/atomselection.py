@@ -272,11 +272,8 @@ class Atomselection:
                     if atom.id == int(k):
                         result.append(atom)
         if inv:
-            r = []
-            for atom in self.atoms:
-                if atom not in result:
-                    r.append(atom)
-            return r
+            selected = set(result)
+            return [atom for atom in self.atoms if atom not in selected]
         else:
             return result
 
@@ -8,6 +8,8 @@ from copy import deepcopy
 
 # Constants
 kb = 0.00831447215   # kJ/(K*mol)
+# number of bootstrap samples held in memory at once by Crooks
+_BOOT_BLOCK_SIZE = 100
 
 
 class Jarz(object):
@@ -24,6 +26,15 @@ class Jarz(object):
     T : float or int
     nboots : int
         number of bootstrap samples to use for error estimation.
+    boot_idx_f : array_like, optional
+        (nboots, len(wf)) array with the indices of the forward work values
+        in each bootstrap sample, see bootstrap_indices. Default is None
+        (the indices are drawn from rng).
+    boot_idx_r : array_like, optional
+        same as boot_idx_f, for the reverse work values.
+    rng : numpy.random.RandomState, optional
+        random number generator used for the bootstrap. Default is the
+        global numpy generator.
 
     Examples
     --------
@@ -34,7 +45,8 @@ class Jarz(object):
 
     '''
 
-    def __init__(self, wf, wr, T, nboots=0, nblocks=1, statesProvided='AB'):
+    def __init__(self, wf, wr, T, nboots=0, nblocks=1, statesProvided='AB',
+                 boot_idx_f=None, boot_idx_r=None, rng=None):
         if 'A' in statesProvided:
             self.wf = np.array(wf)
         if 'B' in statesProvided:
@@ -54,10 +66,14 @@ class Jarz(object):
         if nboots > 0:
             if 'A' in statesProvided:
                 self.err_boot_for = self.calc_err_boot(w=self.wf, T=self.T,
-                                                   c=1.0, nboots=nboots)
+                                                   c=1.0, nboots=nboots,
+                                                   boot_idx=boot_idx_f,
+                                                   rng=rng)
             if 'B' in statesProvided:
                 self.err_boot_rev = self.calc_err_boot(w=self.wr, T=self.T,
-                                                   c=-1.0, nboots=nboots)
+                                                   c=-1.0, nboots=nboots,
+                                                   boot_idx=boot_idx_r,
+                                                   rng=rng)
 
         if nblocks > 1:
             if 'A' in statesProvided:
@@ -95,7 +111,7 @@ class Jarz(object):
         return dg
 
     @staticmethod
-    def calc_err_boot(w, T, c, nboots):
+    def calc_err_boot(w, T, c, nboots, boot_idx=None, rng=None):
         '''Calculates the standard error via bootstrap. The work values are
         resampled randomly with replacement multiple (nboots) times,
         and the Jarzinski free energy recalculated for each bootstrap samples.
@@ -112,23 +128,23 @@ class Jarz(object):
             ???
         nboots: int
             number of bootstrap samples to use for the error estimate.
+        boot_idx : array_like, optional
+            (nboots, len(w)) array with the indices of the bootstrap samples.
+            Default is None (the indices are drawn from rng).
+        rng : numpy.random.RandomState, optional
+            random number generator. Default is the global numpy generator.
 
         Returns
         -------
         err : float
             standard error of the mean.
         '''
-        dg_boots = []
-        n = len(w)
-        for k in range(nboots):
-            sys.stdout.write('\r  Bootstrap (Std Err): iteration %s/%s'
-                             % (k+1, nboots))
-            sys.stdout.flush()
-
-            boot = np.random.choice(w, size=n, replace=True)
-            dg_boot = -1.0 * Jarz.calc_dg(boot, T, c)
-            dg_boots.append(dg_boot)
-        sys.stdout.write('\n')
+        if boot_idx is None:
+            boot_idx = bootstrap_indices(len(w), nboots, rng=rng)
+        # all the bootstrap samples are evaluated at once, one per row
+        beta = 1./(kb*T)
+        boots = np.asarray(w)[boot_idx]
+        dg_boots = kb*T*np.log(np.mean(np.exp(-beta*c*boots), axis=1))
         err = np.std(dg_boots)
         return err
 
@@ -191,6 +207,15 @@ class JarzGauss:
         of the standard error. Default is one (do not estimate the error).
     statesProvided: str, optional
         two directions or one
+    boot_idx_f : array_like, optional
+        (nboots, len(wf)) array with the indices of the forward work values
+        in each bootstrap sample, see bootstrap_indices. Default is None
+        (the indices are drawn from rng).
+    boot_idx_r : array_like, optional
+        same as boot_idx_f, for the reverse work values.
+    rng : numpy.random.RandomState, optional
+        random number generator used for the bootstrap. Default is the
+        global numpy generator.
     Examples
     --------
     >>> estimate = JarzGauss(wf, wr, T=300, nboots=1000, nblocks=10)
@@ -225,7 +250,8 @@ class JarzGauss:
         separating the input work values into groups/blocks.
     '''
 
-    def __init__(self, wf, wr, T=298.15, nboots=0, nblocks=1, statesProvided='AB'):
+    def __init__(self, wf, wr, T=298.15, nboots=0, nblocks=1, statesProvided='AB',
+                 boot_idx_f=None, boot_idx_r=None, rng=None):
         if 'A' in statesProvided:
             self.wf = np.array(wf)
         if 'B' in statesProvided:
@@ -246,11 +272,15 @@ class JarzGauss:
             if 'A' in statesProvided:
                 self.err_boot_for = self.calc_err_boot(w=self.wf, T=self.T,
                                                        nboots=self.nboots,
-                                                       bReverse=False)
+                                                       bReverse=False,
+                                                       boot_idx=boot_idx_f,
+                                                       rng=rng)
             if 'B' in statesProvided:
                 self.err_boot_rev = self.calc_err_boot(w=self.wr, T=self.T,
                                                        nboots=self.nboots,
-                                                       bReverse=True)
+                                                       bReverse=True,
+                                                       boot_idx=boot_idx_r,
+                                                       rng=rng)
 
         if nblocks > 1:
             if 'A' in statesProvided:
@@ -321,7 +351,7 @@ class JarzGauss:
         return dg_stderr
 
     @staticmethod
-    def calc_err_boot(w, T, nboots, bReverse=False):
+    def calc_err_boot(w, T, nboots, bReverse=False, boot_idx=None, rng=None):
         '''Calculates the standard error via bootstrap. The work values are
         resampled randomly with replacement multiple (nboots) times,
         and the Gaussian approximation for Jarzinski free energy
@@ -340,22 +370,27 @@ class JarzGauss:
             whether the work values provided are for the reverse transition.
             Default if False. If they are for the reverse transition, set it to
             True.
+        boot_idx : array_like, optional
+            (nboots, len(w)) array with the indices of the bootstrap samples.
+            Default is None (the indices are drawn from rng).
+        rng : numpy.random.RandomState, optional
+            random number generator. Default is the global numpy generator.
         Returns
         -------
         err : float
             standard error of the mean.
         '''
-        dg_boots = []
-        n = len(w)
-        for k in range(nboots):
-            sys.stdout.write('\r  Bootstrap (Std Err): iteration %s/%s'
-                             % (k+1, nboots))
-            sys.stdout.flush()
-
-            boot = np.random.choice(w, size=n, replace=True)
-            dg_boot = JarzGauss.calc_dg(boot, T, bReverse)
-            dg_boots.append(dg_boot)
-        sys.stdout.write('\n')
+        if boot_idx is None:
+            boot_idx = bootstrap_indices(len(w), nboots, rng=rng)
+        beta = 1./(kb*T)
+        if bReverse is False:
+            c = 1.0
+        elif bReverse is True:
+            c = -1.0
+        # all the bootstrap samples are evaluated at once, one per row
+        boots = c*np.asarray(w)[boot_idx]
+        dg_boots = c*(np.mean(boots, axis=1) -
+                      (beta * np.var(boots, axis=1, ddof=1)) * 0.5)
         err = np.std(dg_boots)
         return err
 
@@ -414,6 +449,21 @@ class Crooks(object):
         array of forward work values.
     wr : array_like
         array of reverse work values.
+    nboots : int, optional
+        number of bootstrap samples to use for the non-parametric bootstrap
+        error estimate. Default is zero (do not estimate the error).
+    nblocks : int, optional
+        how many blocks to divide the input work values into for the estimation
+        of the standard error. Default is one (do not estimate the error).
+    boot_idx_f : array_like, optional
+        (nboots, len(wf)) array with the indices of the forward work values
+        in each bootstrap sample, see bootstrap_indices. Default is None
+        (the indices are drawn from rng).
+    boot_idx_r : array_like, optional
+        same as boot_idx_f, for the reverse work values.
+    rng : numpy.random.RandomState, optional
+        random number generator used for the bootstrap. Default is the
+        global numpy generator.
 
     Examples
     --------
@@ -444,7 +494,8 @@ class Crooks(object):
         standard deviation of the reverse Gaussian.
     '''
 
-    def __init__(self, wf, wr, nboots=0, nblocks=1):
+    def __init__(self, wf, wr, nboots=0, nblocks=1, boot_idx_f=None,
+                 boot_idx_r=None, rng=None):
 
         # inputs
         self.wf = np.array(wf)
@@ -461,10 +512,13 @@ class Crooks(object):
         self.err_boot1 = self.calc_err_boot1(m1=self.mf, s1=self.devf,
                                              n1=len(wf), m2=self.mr,
                                              s2=self.devr, n2=len(wr),
-                                             nboots=1000)
+                                             nboots=1000, rng=rng)
         if nboots > 0:
             self.err_boot2 = self.calc_err_boot2(wf=self.wf, wr=self.wr,
-                                                 nboots=nboots)
+                                                 nboots=nboots,
+                                                 boot_idx_f=boot_idx_f,
+                                                 boot_idx_r=boot_idx_r,
+                                                 rng=rng)
 
         if nblocks > 1:
             self.err_blocks = self.calc_err_blocks(self.wf, self.wr, nblocks)
@@ -516,12 +570,49 @@ class Crooks(object):
             dg = (m1 + m2) * 0.5
             return dg, False
 
+    @staticmethod
+    def _boot_moments(sample, nboots):
+        '''Returns the means and standard deviations of nboots bootstrap
+        samples. sample(i, j) returns the samples i to j, one per row; they
+        are built and reduced in blocks of _BOOT_BLOCK_SIZE rows, so that
+        the whole (nboots, n) array is never held in memory.
+        '''
+
+        m = np.empty(nboots)
+        s = np.empty(nboots)
+        for i in range(0, nboots, _BOOT_BLOCK_SIZE):
+            j = min(i + _BOOT_BLOCK_SIZE, nboots)
+            boots = sample(i, j)
+            m[i:j] = np.average(boots, axis=1)
+            s[i:j] = np.std(boots, axis=1)
+        return m, s
+
+    @staticmethod
+    def _calc_dg_boots(m1, s1, m2, s2):
+        '''Calculates the CGI free energy of several bootstrap samples at
+        once, from the arrays of the means and standard deviations of the
+        forward (m1, s1) and reverse (m2, s2) samples; the free energies are
+        returned in an array.
+        '''
+
+        p1 = m1/s1**2-m2/s2**2
+        p2 = np.sqrt(1/(s1**2*s2**2)*(m1-m2)**2+2*(1/s1**2-1/s2**2)*np.log(s2/s1))
+        p3 = 1/s1**2-1/s2**2
+        x1 = (p1+p2)/p3
+        x2 = (p1-p2)/p3
+
+        # same choice of the solution as in calc_dg, for each sample
+        in1 = (x1 > m1) & (x1 < m2) | (x1 > m2) & (x1 < m1)
+        in2 = (x2 > m1) & (x2 < m2) | (x2 > m2) & (x2 < m1)
+        dg = np.where(in1, x1, np.where(in2, x2, (m1 + m2) * 0.5))
+        return dg
+
     # Possible change of behaviour compared to the original script:
     # here it is not determined in advanced whether to take the intersection
     # or the mean, but for each bootstrap sample if the intersecion cannot
     # be taken, then the mean is used automatically.
     @staticmethod
-    def calc_err_boot1(m1, s1, n1, m2, s2, n2, nboots=1000):
+    def calc_err_boot1(m1, s1, n1, m2, s2, n2, nboots=1000, rng=None):
         '''Calculates the standard error of the Crooks Gaussian Intersection
         via parametric bootstrap. Given the parameters of the forward and
         reverse Gaussian distributions, multiple (nboots) bootstrap samples
@@ -549,6 +640,8 @@ class Crooks(object):
             number of bootstrap samples to use for the error estimate.
             Parametric bootstrap is used where work values are resampled from
             two Gaussians.
+        rng : numpy.random.RandomState, optional
+            random number generator. Default is the global numpy generator.
 
         Returns
         -------
@@ -556,18 +649,20 @@ class Crooks(object):
             standard error of the mean.
         '''
 
-        dg_boots = []
-        for k in range(nboots):
-            bootA = np.random.normal(loc=m1, scale=s1, size=n1)
-            bootB = np.random.normal(loc=m2, scale=s2, size=n2)
-
-            dg_boot, _ = Crooks.calc_dg(bootA, bootB)
-            dg_boots.append(dg_boot)
+        if rng is None:
+            rng = np.random
+        # all the forward samples are drawn before the reverse ones
+        mA, sA = Crooks._boot_moments(
+            lambda i, j: rng.normal(loc=m1, scale=s1, size=(j-i, n1)), nboots)
+        mB, sB = Crooks._boot_moments(
+            lambda i, j: rng.normal(loc=m2, scale=s2, size=(j-i, n2)), nboots)
+        dg_boots = Crooks._calc_dg_boots(mA, sA, mB, sB)
         err = np.std(dg_boots)
         return err
 
     @staticmethod
-    def calc_err_boot2(wf, wr, nboots):
+    def calc_err_boot2(wf, wr, nboots, boot_idx_f=None, boot_idx_r=None,
+                       rng=None):
         '''Calculates the standard error of the Crooks Gaussian Intersection
         via non-parametric bootstrap. The work values are resampled randomly
         with replacement multiple (nboots) times, and the CGI free energy
@@ -583,6 +678,13 @@ class Crooks(object):
             array of reverse work values.
         nboots: int
             number of bootstrap samples to use for the error estimate.
+        boot_idx_f : array_like, optional
+            (nboots, len(wf)) array with the indices of the forward bootstrap
+            samples. Default is None (the indices are drawn from rng).
+        boot_idx_r : array_like, optional
+            same as boot_idx_f, for the reverse work values.
+        rng : numpy.random.RandomState, optional
+            random number generator. Default is the global numpy generator.
 
         Returns
         -------
@@ -590,22 +692,18 @@ class Crooks(object):
             standard error of the mean.
         '''
 
-        nf = len(wf)
-        nr = len(wr)
-
-        dg_boots = []
-        for k in range(nboots):
-            sys.stdout.write('\r  Bootstrap (Std Err): iteration %s/%s'
-                             % (k+1, nboots))
-            sys.stdout.flush()
-
-            bootA = np.random.choice(wf, size=nf, replace=True)
-            bootB = np.random.choice(wr, size=nr, replace=True)
-
-            dg_boot, _ = Crooks.calc_dg(bootA, bootB)
-            dg_boots.append(dg_boot)
-
-        sys.stdout.write('\n')
+        if boot_idx_f is None:
+            boot_idx_f = bootstrap_indices(len(wf), nboots, rng=rng)
+        if boot_idx_r is None:
+            boot_idx_r = bootstrap_indices(len(wr), nboots, rng=rng)
+
+        wf = np.asarray(wf)
+        wr = np.asarray(wr)
+        mA, sA = Crooks._boot_moments(lambda i, j: wf[boot_idx_f[i:j]],
+                                      len(boot_idx_f))
+        mB, sB = Crooks._boot_moments(lambda i, j: wr[boot_idx_r[i:j]],
+                                      len(boot_idx_r))
+        dg_boots = Crooks._calc_dg_boots(mA, sA, mB, sB)
         err = np.std(dg_boots)
         return err
 
@@ -651,12 +749,34 @@ class BAR(object):
 
     Parameters
     ----------
+    wf : array_like
+        array of forward work values.
+    wr : array_like
+        array of reverse work values.
+    T : float or int
+        temperature in Kelvin.
+    nboots : int, optional
+        number of bootstrap samples to use for error estimation. Default is
+        zero (do not estimate the error).
+    nblocks : int, optional
+        how many blocks to divide the input work values into for the estimation
+        of the standard error. Default is one (do not estimate the error).
+    boot_idx_f : array_like, optional
+        (nboots, len(wf)) array with the indices of the forward work values
+        in each bootstrap sample, see bootstrap_indices. Default is None
+        (the indices are drawn from rng).
+    boot_idx_r : array_like, optional
+        same as boot_idx_f, for the reverse work values.
+    rng : numpy.random.RandomState, optional
+        random number generator used for the bootstrap. Default is the
+        global numpy generator.
 
     Examples
     --------
     '''
 
-    def __init__(self, wf, wr, T, nboots=0, nblocks=1):
+    def __init__(self, wf, wr, T, nboots=0, nblocks=1, boot_idx_f=None,
+                 boot_idx_r=None, rng=None):
         self.wf = np.array(wf)
         self.wr = np.array(wr)
         self.T = float(T)
@@ -672,13 +792,22 @@ class BAR(object):
         self.dg = self.calc_dg(self.wf, self.wr, self.T)
         self.err = self.calc_err(self.dg, self.wf, self.wr, self.T)
         if nboots > 0:
+            # the same bootstrap samples are used for the error of the
+            # estimate and of its convergence
+            if boot_idx_f is None:
+                boot_idx_f = bootstrap_indices(self.nf, nboots, rng=rng)
+            if boot_idx_r is None:
+                boot_idx_r = bootstrap_indices(self.nr, nboots, rng=rng)
             self.err_boot = self.calc_err_boot(self.wf, self.wr, nboots,
-                                               self.T)
+                                               self.T, boot_idx_f=boot_idx_f,
+                                               boot_idx_r=boot_idx_r)
         self.conv = self.calc_conv(self.dg, self.wf, self.wr, self.T)
         if nboots > 0:
             self.conv_err_boot = self.calc_conv_err_boot(self.dg, self.wf,
                                                          self.wr, nboots,
-                                                         self.T)
+                                                         self.T,
+                                                         boot_idx_f=boot_idx_f,
+                                                         boot_idx_r=boot_idx_r)
         if nblocks > 1:
             self.err_blocks = self.calc_err_blocks(self.wf, self.wr, nblocks,
                                                    self.T)
@@ -760,7 +889,8 @@ class BAR(object):
         return err
 
     @staticmethod
-    def calc_err_boot(wf, wr, nboots, T):
+    def calc_err_boot(wf, wr, nboots, T, boot_idx_f=None, boot_idx_r=None,
+                      rng=None):
         '''Calculates the error by bootstrapping.
 
         Parameters
@@ -773,19 +903,30 @@ class BAR(object):
             temperature
         nboots: int
             number of bootstrap samples.
+        boot_idx_f : array_like, optional
+            (nboots, len(wf)) array with the indices of the forward bootstrap
+            samples. Default is None (the indices are drawn from rng).
+        boot_idx_r : array_like, optional
+            same as boot_idx_f, for the reverse work values.
+        rng : numpy.random.RandomState, optional
+            random number generator. Default is the global numpy generator.
 
         '''
 
-        nf = len(wf)
-        nr = len(wr)
+        wf = np.asarray(wf)
+        wr = np.asarray(wr)
+        if boot_idx_f is None:
+            boot_idx_f = bootstrap_indices(len(wf), nboots, rng=rng)
+        if boot_idx_r is None:
+            boot_idx_r = bootstrap_indices(len(wr), nboots, rng=rng)
         dg_boots = []
         for k in range(nboots):
             sys.stdout.write('\r  Bootstrap (Std Err): iteration %s/%s'
                              % (k+1, nboots))
             sys.stdout.flush()
 
-            bootA = np.random.choice(wf, size=nf, replace=True)
-            bootB = np.random.choice(wr, size=nr, replace=True)
+            bootA = wf[boot_idx_f[k]]
+            bootB = wr[boot_idx_r[k]]
             dg_boot = BAR.calc_dg(bootA, bootB, T)
             dg_boots.append(dg_boot)
 
@@ -868,17 +1009,22 @@ class BAR(object):
         return conv
 
     @staticmethod
-    def calc_conv_err_boot(dg, wf, wr, nboots, T):
-        nf = len(wf)
-        nr = len(wr)
+    def calc_conv_err_boot(dg, wf, wr, nboots, T, boot_idx_f=None,
+                           boot_idx_r=None, rng=None):
+        wf = np.asarray(wf)
+        wr = np.asarray(wr)
+        if boot_idx_f is None:
+            boot_idx_f = bootstrap_indices(len(wf), nboots, rng=rng)
+        if boot_idx_r is None:
+            boot_idx_r = bootstrap_indices(len(wr), nboots, rng=rng)
         conv_boots = []
         for k in range(nboots):
             sys.stdout.write('\r  Bootstrap (Conv): '
                              'iteration %s/%s' % (k+1, nboots))
             sys.stdout.flush()
 
-            bootA = np.random.choice(wf, size=nf, replace=True)
-            bootB = np.random.choice(wr, size=nr, replace=True)
+            bootA = wf[boot_idx_f[k]]
+            bootB = wr[boot_idx_r[k]]
             conv_boot = BAR.calc_conv(dg, bootA, bootB, T)
             conv_boots.append(conv_boot)
 
@@ -982,6 +1128,30 @@ def ks_norm_test(data, alpha=0.05, refks=None):
     return (1-q), lam0, check, bOk
 
 
+def bootstrap_indices(n, nboots, rng=None):
+    '''Draws the indices of bootstrap samples, i.e. random samples with
+    replacement, of n values.
+
+    Parameters
+    ----------
+    n : int
+        number of values (e.g. work values) that are resampled.
+    nboots : int
+        number of bootstrap samples.
+    rng : numpy.random.RandomState, optional
+        random number generator. Default is the global numpy generator.
+
+    Returns
+    -------
+    idx : array
+        (nboots, n) array of int32: each row contains the indices of one
+        bootstrap sample.
+    '''
+    if rng is None:
+        rng = np.random
+    return rng.randint(0, n, size=(nboots, n), dtype=np.int32)
+
+
 def data2gauss(data):
     '''Takes a one dimensional array and fits a Gaussian.
 
@@ -131,6 +131,19 @@ class Rotation:
     def apply(self,v, phi):
         return _p.apply_rotation( self, [v[0], v[1], v[2]], phi)
 
+    def apply_all(self, atoms, phi):
+        """ rotate the coordinates of all atoms in one go"""
+        if not atoms:
+            return
+        v2 = array(self.v2)
+        vec = array([atom.x for atom in atoms], dtype=float) - v2
+        b = dot(vec, array(self.m1).T)
+        d = dot(vec, array(self.m2).T)
+        cc = cos(phi)
+        vec = cc*vec + b - cc*b + sin(phi)*d + v2
+        for atom, x in zip(atoms, vec.tolist()):
+            atom.x = x
+
 
 
     
@@ -682,7 +682,7 @@ class Model(Atomselection):
         nter = []
         for ch in model.chains:
             first = ch.residues[0]      # first residue
-            if first.resname in library._one_letter.keys():
+            if first.resname in library._one_letter:
                 nter.append(first)
         return nter
 
@@ -690,7 +690,7 @@ class Model(Atomselection):
         cter = []
         for ch in model.chains:
             last = ch.residues[-1]      # last residue
-            if last.resname in library._one_letter.keys():
+            if last.resname in library._one_letter:
                 cter.append(last)
         return last
 
@@ -118,7 +118,7 @@ class Molecule(Atomselection):
                 a.id = i+1
                 a.name = entry[0]
                 a.symbol = a.name[0]
-                a.x = entry[1]
+                a.x = entry[1][:] # own coordinates, not the library template
                 a.occ = 1.
                 a.resname = resname
                 a.m = library._atommass[a.symbol]
@@ -163,8 +163,7 @@ class Molecule(Atomselection):
                 for r in self.chain.residues[chidx+1:]:
                     for atom in r.atoms:
                         rot_atoms.append( atom )
-        for atom in rot_atoms:
-            atom.x = R.apply(atom.x, diff)
+        R.apply_all(rot_atoms, diff)
 
     def set_psi_down( self, degree, propagate = True ):
         psi = self.get_psi()
@@ -178,8 +177,7 @@ class Molecule(Atomselection):
                 for r in self.chain.residues[:chidx]:
                     for atom in r.atoms:
                         rot_atoms.append( atom )
-        for atom in rot_atoms:
-            atom.x = R.apply(atom.x, diff)
+        R.apply_all(rot_atoms, diff)
         
 
 
@@ -211,8 +209,7 @@ class Molecule(Atomselection):
                 for r in self.chain.residues[chidx+1:]:
                     for atom in r.atoms:
                         rot_atoms.append( atom )
-        for atom in rot_atoms:
-            atom.x = R.apply(atom.x, diff)
+        R.apply_all(rot_atoms, diff)
 
     def set_phi_down(self, degree, propagate = True ):
         if self.resname == 'PRO': return # does not work
@@ -227,8 +224,7 @@ class Molecule(Atomselection):
                 for r in self.chain.residues[:chidx]:
                     for atom in r.atoms:
                         rot_atoms.append( atom )
-        for atom in rot_atoms:
-            atom.x = R.apply(atom.x, diff)
+        R.apply_all(rot_atoms, diff)
         
 
 
@@ -262,8 +258,7 @@ class Molecule(Atomselection):
             for r in self.chain.residues[chidx+1:]:
                 for atom in r.atoms:
                     rot_atoms.append( atom )
-        for atom in rot_atoms:
-            atom.x = R.apply(atom.x, diff)
+        R.apply_all(rot_atoms, diff)
 
     def set_omega_down(self, degree):
         phi = self.get_omega()
@@ -281,8 +276,7 @@ class Molecule(Atomselection):
             for r in self.chain.residues[:chidx]:
                 for atom in r.atoms:
                     rot_atoms.append( atom )
-        for atom in rot_atoms:
-            atom.x = R.apply(atom.x, diff)
+        R.apply_all(rot_atoms, diff)
         
 
     def nchi(self):
@@ -308,8 +302,7 @@ class Molecule(Atomselection):
         rot_atoms = self.fetch_atoms( _aa_chi[self.real_resname][chi][1] )
         delta = phi/180*pi - ang
         r = Rotation( dih_atoms[1].x, dih_atoms[2].x )
-        for atom in rot_atoms:
-            atom.x = r.apply( atom.x, delta )
+        r.apply_all( rot_atoms, delta )
 
     def set_conformation(self, rotamer):
         self.get_real_resname()
@@ -191,11 +191,11 @@ def get_rotamers(bbdep, resname, phi, psi, residue = False, hydrogens = True, fu
             r.set_resname(real_res)
             for chi in range(nchi):
                 r.set_chi(chi+1,rotamers[i][chi+1])
-            res_list.append(r.copy())
+            res_list.append(r)
 
     else:
         r = molecule.Molecule().new_aa(resname, hydrogens = hydrogens)
-        res_list = [ r.copy() ]
+        res_list = [ r ]
     if residue:
         for r in res_list:
             fit( residue, r, atom_names = ['N','CA','C'] )
@@ -31,19 +31,79 @@
 
 from __future__ import print_function, division
 from pmx.parser import read_and_format
-from pmx.estimators import Jarz, JarzGauss, Crooks, BAR, data2gauss, ks_norm_test
 import sys
 import os
 import time
 import re
+import glob
+import warnings
 import numpy as np
-from scipy.integrate import simps
 import pickle
 import argparse
+from multiprocessing import Pool
 from cli import check_unknown_cmd
 
 # Constants
 kb = 0.00831447215   # kJ/(K*mol)
+# number of dgdl.xvg files integrated together in one block
+_DGDL_BLOCK_SIZE = 512
+
+# lines of the report: {p} and {u} are replaced by the precision and the
+# units once (see _report_templates), the values are filled in when printed
+_REPORT_LINES = {
+    'cgi_mf':
+        '  CGI: Forward Gauss mean = {m:8.{p}f} {u} std = {s:8.{p}f} {u}',
+    'cgi_mr':
+        '  CGI: Reverse Gauss mean = {m:8.{p}f} {u} std = {s:8.{p}f} {u}',
+    'cgi_dg':
+        '  CGI: dG = {dg:8.{p}f} {u}',
+    'cgi_err_boot1':
+        '  CGI: Std Err (bootstrap:parametric) = {e:8.{p}f} {u}',
+    'cgi_err_boot2':
+        '  CGI: Std Err (bootstrap) = {e:8.{p}f} {u}',
+    'cgi_err_blocks':
+        '  CGI: Std Err (blocks) = {e:8.{p}f} {u}',
+    'bar_dg':
+        '  BAR: dG = {dg:8.{p}f} {u}',
+    'bar_err':
+        '  BAR: Std Err (analytical) = {e:8.{p}f} {u}',
+    'bar_err_boot':
+        '  BAR: Std Err (bootstrap)  = {e:8.{p}f} {u}',
+    'bar_err_blocks':
+        '  BAR: Std Err (blocks)  = {e:8.{p}f} {u}',
+    'jarz_dg_for':
+        '  JARZ: dG Forward = {dg:8.{p}f} {u}',
+    'jarz_dg_rev':
+        '  JARZ: dG Reverse = {dg:8.{p}f} {u}',
+    'jarz_dg_mean':
+        '  JARZ: dG Mean    = {dg:8.{p}f} {u}',
+    'jarz_err_boot_for':
+        '  JARZ: Std Err Forward (bootstrap) = {e:8.{p}f} {u}',
+    'jarz_err_boot_rev':
+        '  JARZ: Std Err Reverse (bootstrap) = {e:8.{p}f} {u}',
+    'jarz_err_blocks_for':
+        '  JARZ: Std Err Forward (blocks) = {e:8.{p}f} {u}',
+    'jarz_err_blocks_rev':
+        '  JARZ: Std Err Reverse (blocks) = {e:8.{p}f} {u}',
+    'jarz_gauss_dg_for':
+        '  JARZ_Gauss: dG Forward = {dg:8.{p}f} {u}',
+    'jarz_gauss_dg_rev':
+        '  JARZ_Gauss: dG Reverse = {dg:8.{p}f} {u}',
+    'jarz_gauss_dg_mean':
+        '  JARZ_Gauss: dG Mean    = {dg:8.{p}f} {u}',
+    'jarz_gauss_err_for':
+        '  JARZ_Gauss: Std Err (analytical) Forward = {dg:8.{p}f} {u}',
+    'jarz_gauss_err_rev':
+        '  JARZ_Gauss: Std Err (analytical) Reverse = {dg:8.{p}f} {u}',
+    'jarz_gauss_err_boot_for':
+        '  JARZ_Gauss: Std Err Forward (bootstrap) = {e:8.{p}f} {u}',
+    'jarz_gauss_err_boot_rev':
+        '  JARZ_Gauss: Std Err Reverse (bootstrap) = {e:8.{p}f} {u}',
+    'jarz_gauss_err_blocks_for':
+        '  JARZ_Gauss: Std Err Forward (blocks) = {e:8.{p}f} {u}',
+    'jarz_gauss_err_blocks_rev':
+        '  JARZ_Gauss: Std Err Reverse (blocks) = {e:8.{p}f} {u}',
+}
 
 
 # ==============================================================================
@@ -60,36 +120,8 @@ def gauss_func(A, mean, dev, x):
 # -------------
 # Files Parsing
 # -------------
-def _longest_dgdl_file( lst ):
-    '''Takes a list of dgdl.xvg files and returns the id (starting from 0) of 
-    of the longest file.
-
-    Parameters
-    ----------
-    lst : list
-        list containing the paths to the dgdl.xvg files.
-
-    Returns
-    -------
-    ind : int
-        index of the longest file
-    '''
-
-    ind = 0
-    maxlen = -9999
-    for idx, f in enumerate(lst[0:]):
-        try:
-            fp = open(f)
-            lines = fp.readlines()
-            if len(lines)>maxlen:
-                maxlen = len(lines)
-                ind = idx
-        except:
-            pass
-    return(ind)
-
-
-def parse_dgdl_files(lst, lambda0=0, invert_values=False):
+def parse_dgdl_files(lst, lambda0=0, invert_values=False, nproc=1,
+                     cache=None):
     '''Takes a list of dgdl.xvg files and returns the integrated work values
 
     Parameters
@@ -100,6 +132,12 @@ def parse_dgdl_files(lst, lambda0=0, invert_values=False):
         whether the simulations started from lambda 0 or 1. Default is 0.
     invert_values : bool
         whether to invert the sign of the returned work value.
+    nproc : int, optional
+        number of processes used to read the files. Default is 1 (serial).
+    cache : dict, optional
+        previously read files, as returned by load_work_cache. Files found
+        in the cache are not read again, and the newly read files are added
+        to it. Default is None (no cache).
 
     Returns
     -------
@@ -113,29 +151,221 @@ def parse_dgdl_files(lst, lambda0=0, invert_values=False):
     # check lambda0 is either 0 or 1
     assert lambda0 in [0, 1]
 
-    # identify file with the most entries
-    imax = _longest_dgdl_file( lst )
-
-    _check_dgdl(lst[imax], lambda0)
-    first_w, ndata = integrate_dgdl(lst[imax], lambda0=lambda0,
-                                    invert_values=invert_values)
-    w_list = [first_w]
-    for idx, f in enumerate(lst[0:]):
-        if idx==imax: # already processed
-            continue
-        sys.stdout.write('\r    Reading %s' % f)
+    keys = [None] * len(lst)
+    if cache is not None:
+        keys = [_work_cache_key(f, lambda0, invert_values) for f in lst]
+    info = [None] * len(lst)
+    todo = []
+    for idx, key in enumerate(keys):
+        if key is not None and key in cache:
+            info[idx] = cache[key]
+        else:
+            todo.append(idx)
+    if len(todo) < len(lst):
+        print('    Using %d cached work values' % (len(lst) - len(todo)))
+
+    # the workers only read the files: the dgdl values of the files with
+    # the same number of data points are stacked and integrated in blocks,
+    # with a single call per block. The files that do not have as many
+    # points as the longest one are dropped afterwards
+    others = [lst[idx] for idx in todo]
+    pool = None
+    if nproc > 1 and len(others) > 1:
+        # the files are independent of each other: parse them in a pool of
+        # workers, Pool.imap keeps the order of the input list
+        sys.stdout.write('    Reading %d files with %d processes' %
+                         (len(others), nproc))
         sys.stdout.flush()
+        pool = Pool(processes=nproc)
+        chunksize = max(1, len(others) // (4*nproc))
+        data = pool.imap(_read_dgdl_file, others, chunksize)
+    else:
+        def _read_all():
+            for f in others:
+                sys.stdout.write('\r    Reading %s' % f)
+                sys.stdout.flush()
+                yield _read_dgdl_file(f)
+        data = _read_all()
+
+    blocks = {}
+    # Simpson weights by number of data points, built once for all blocks
+    weights = {}
+    def _integrate_blocks():
+        for n, block in blocks.items():
+            if n >= 4 and n not in weights:
+                weights[n] = _simpson_weights(n, 1./float(n))
+            w = _integrate_dgdl_values(np.vstack([y for _, _, y, _ in block]),
+                                       lambda0=lambda0,
+                                       invert_values=invert_values,
+                                       weights=weights.get(n))
+            for (idx, nl, y, tlast), wi in zip(block, w):
+                info[idx] = (nl, len(y), wi, tlast)
+                if keys[idx] is not None:
+                    cache[keys[idx]] = info[idx]
+        blocks.clear()
 
-        w, _ = integrate_dgdl(f, ndata=ndata, lambda0=lambda0,
-                              invert_values=invert_values)
-        if w is not None:
-            w_list.append(w)
-
+    try:
+        npending = 0
+        for idx, (nl, y, tlast) in zip(todo, data):
+            if y is None or len(y) == 0:
+                info[idx] = (nl, None if y is None else 0, None, None)
+                if keys[idx] is not None and nl is not None:
+                    cache[keys[idx]] = info[idx]
+                continue
+            blocks.setdefault(len(y), []).append((idx, nl, y, tlast))
+            npending += 1
+            if npending == _DGDL_BLOCK_SIZE:
+                _integrate_blocks()
+                npending = 0
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    _integrate_blocks()
     print('\n')
 
+    # identify file with the most entries, the first one of them if there
+    # are several; unreadable and empty files have no entries
+    imax = None
+    for idx, d in enumerate(info):
+        if d[0] and (imax is None or d[0] > info[imax][0]):
+            imax = idx
+    if imax is None or not info[imax][1]:
+        # the number of data points expected is taken from this file
+        exit(' !! Cannot read the data points of %s, the longest of the'
+             ' dhdl.xvg files' % (lst[0] if imax is None else lst[imax]))
+    nlines, ndata, w, tlast = info[imax]
+    _check_dgdl(ndata, tlast, lambda0)
+
+    w_list = [w]
+    for idx, (nl, n, w, _) in enumerate(info):
+        if idx == imax or not nl:
+            continue
+        if n is None:
+            print(' !! Skipping %s (incomplete file, probably simulation '
+                  'crashed)\n' % lst[idx])
+        elif n != ndata:
+            print(' !! Skipping %s ( read %d data points, should be %d )' %
+                  (lst[idx], n, ndata))
+        else:
+            w_list.append(w)
     return w_list
 
 
+def _read_dgdl_file(fn):
+    '''Reads one dgdl.xvg file for parse_dgdl_files.
+
+    Parameters
+    ----------
+    fn : str
+        the input dgdl.xvg file from Gromacs.
+
+    Returns
+    -------
+    nlines : int
+        number of lines in the file, None if it cannot be read.
+    y : array
+        array of dgdl values, None if they cannot be read.
+    tlast : float
+        time of the last data point, None if there is none.
+    '''
+    try:
+        with open(fn) as f:
+            lines = f.readlines()
+    except:
+        return None, None, None
+    nlines = len(lines)
+    lines = [l for l in lines if l[0] not in '#@&']
+    if not lines:
+        return nlines, np.zeros(0), None
+    try:
+        y = _xvg_column(lines, col=1)
+        tlast = float(lines[-1].split()[0])
+    except ValueError:
+        return nlines, None, None
+    return nlines, y, tlast
+
+
+def _work_cache_key(fn, lambda0, invert_values):
+    '''Returns the key identifying the work value of a dgdl.xvg file in the
+    work cache: the file is read again when it is modified. None if the
+    file does not exist.'''
+    try:
+        st = os.stat(fn)
+    except OSError:
+        return None
+    return '%s|%r|%d|%d|%d' % (os.path.abspath(fn), st.st_mtime, st.st_size,
+                               lambda0, invert_values)
+
+
+def load_work_cache(fn):
+    '''Reads the work values cached by a previous run.
+
+    Parameters
+    ----------
+    fn : str
+        npz file with the cached work values.
+
+    Returns
+    -------
+    cache : dict
+        dictionary mapping the cache keys of the dgdl.xvg files to tuples
+        with the number of lines, the number of data points, the work value
+        and the time of the last data point, as stored by
+        parse_dgdl_files. Empty if the file does not exist or cannot be
+        read.
+    '''
+    if not os.path.isfile(fn):
+        return {}
+    try:
+        data = np.load(fn)
+        cache = {}
+        for key, nlines, ndata, w, tlast in zip(data['keys'].tolist(),
+                                                data['nlines'].tolist(),
+                                                data['ndata'].tolist(),
+                                                data['works'].tolist(),
+                                                data['tlast'].tolist()):
+            # files whose data points could not be read are stored as -1
+            if ndata < 0:
+                cache[key] = (nlines, None, None, None)
+            else:
+                cache[key] = (nlines, ndata, w, tlast)
+        data.close()
+    except:
+        print(' !! Ignoring unreadable work cache %s' % fn)
+        return {}
+    return cache
+
+
+def save_work_cache(fn, cache, keys=None):
+    '''Writes the cached work values to an npz file.
+
+    Parameters
+    ----------
+    fn : str
+        output npz file.
+    cache : dict
+        dictionary as returned by load_work_cache.
+    keys : list, optional
+        cache keys of the entries to write, the others are dropped. Default
+        is None (all the entries are written).
+    '''
+    if keys is None:
+        keys = cache.keys()
+    keys = sorted(set(k for k in keys if k in cache))
+    entries = [cache[k] for k in keys]
+    # np.savez appends .npz to file names without that extension
+    with open(fn, 'wb') as f:
+        np.savez(f, keys=np.array(keys),
+                 nlines=np.array([e[0] for e in entries], dtype=int),
+                 ndata=np.array([-1 if e[1] is None else e[1]
+                                 for e in entries], dtype=int),
+                 works=np.array([np.nan if e[2] is None else e[2]
+                                 for e in entries], dtype=float),
+                 tlast=np.array([np.nan if e[3] is None else e[3]
+                                 for e in entries], dtype=float))
+
+
 def integrate_dgdl(fn, ndata=-1, lambda0=0, invert_values=False):
     '''Integrates the data in a dgdl.xvg file.
 
@@ -161,86 +391,214 @@ def integrate_dgdl(fn, ndata=-1, lambda0=0, invert_values=False):
     # check lambda0 is either 0 or 1
     assert lambda0 in [0, 1]
 
+    y = _read_dgdl(fn, ndata=ndata)
+    if y is None:
+        return None, None
+    integr = _integrate_dgdl_values(y, lambda0=lambda0,
+                                    invert_values=invert_values)
+    return integr, len(y)
+
+
+def _read_dgdl(fn, ndata=-1):
+    '''Reads the dgdl values from a dgdl.xvg file.
+
+    Parameters
+    ----------
+    fn : str
+        the input dgdl.xvg file from Gromacs.
+    ndata : int, optional
+        number of datapoints expected in the file. Files with a different
+        number of datapoints are skipped. If -1, no check is done. Default
+        is -1.
+
+    Returns
+    -------
+    y : array
+        array of dgdl values, or None if the file was skipped.
+    '''
+
     try:
-        lines = open(fn).readlines()
+        with open(fn) as f:
+            lines = f.readlines()
     except:
-        return None, None
+        return None
     if not lines:
-        return None, None
+        return None
 
-    # extract dgdl datapoints into r
+    # extract dgdl datapoints into y
     # TODO: we removed the check for file integrity. We could have an
     # optional files integrity check before calling this integration func
 
     lines = [l for l in lines if l[0] not in '#@&']
     try:
-        r = map(lambda x: float(x.split()[1]), lines)
-    except:
-        r = "incomplete_file"
-        ndata = 1
+        y = _xvg_column(lines, col=1)
+    except ValueError:
+        print(' !! Skipping %s (incomplete file, probably simulation crashed)\n' % fn)
+        return None
+
+    if ndata != -1 and len(y) != ndata:
+        print(' !! Skipping %s ( read %d data points, should be %d )' % (fn, len(y), ndata))
+        return None
+    return y
+
+
+def _integrate_dgdl_values(y, lambda0=0, invert_values=False, weights=None):
+    '''Integrates dgdl values over lambda using Simpson's rule.
+
+    Parameters
+    ----------
+    y : array
+        dgdl values of one file, or two dimensional array with the dgdl
+        values of several files (one per row) with the same number of data
+        points.
+    lambda0 : [0,1]
+        whether the simulations started from lambda 0 or 1. Default is 0.
+    invert_values : bool
+        whether to invert the sign of the returned work value.
+    weights : array, optional
+        Simpson weights for the number of data points of y, as returned by
+        _simpson_weights. Default is None (they are built here).
+
+    Returns
+    -------
+    integr : float or array
+        the integrated work value(s).
+    '''
 
-    if ndata != -1 and len(r) != ndata:
-        try:
-            if "incomplete_file" in r:
-                print(' !! Skipping %s (incomplete file, probably simulation crashed)\n' % fn)
-            else:
-                print(' !! Skipping %s ( read %d data points, should be %d )' % (fn, len(r), ndata))
-        except:
-            print(' !! Skipping %s ' % (fn))
-        return None, None
     # convert time to lambda
-    ndata = len(r)
+    ndata = y.shape[-1]
     dlambda = 1./float(ndata)
     if lambda0 == 1:
         dlambda *= -1
 
-    # arrays for the integration
-    # --------------------------
-    # array of lambda values
-    x = [lambda0+i*dlambda for i, dgdl in enumerate(r)]
-    # array of dgdl
-    y = r
+    if ndata < 4:
+        # arrays for the integration
+        # --------------------------
+        # array of lambda values
+        x = lambda0 + np.arange(ndata)*dlambda
 
-    if lambda0 == 1:
-        x.reverse()
-        y.reverse()
+        if lambda0 == 1:
+            x = x[::-1]
+            y = y[..., ::-1]
 
-    if invert_values is True:
-        integr = simps(y, x) * (-1)
-        return integr, ndata
+        from scipy.integrate import simps
+        integr = simps(y, x, axis=-1)
     else:
-        integr = simps(y, x)
-        return integr, ndata
+        # the Simpson weights of evenly spaced points are symmetric, so the
+        # integration in the reverse direction needs no reversal of y
+        if weights is None:
+            weights = _simpson_weights(ndata, abs(dlambda))
+        integr = np.dot(y, weights)
+    if invert_values is True:
+        integr = integr * (-1)
+    return integr
 
 
-def _check_dgdl(fn, lambda0):
-    '''Prints some info about a dgdl.xvg file.'''
-    l = open(fn).readlines()
-    if not l:
-        return None
-    r = []
-    for line in l:
-        if line[0] not in '#@&':
-            r.append([float(x) for x in line.split()])
-    ndata = len(r)
+def _simpson_weights(n, h):
+    '''Returns the weights w of Simpson's rule for n >= 4 evenly spaced
+    points, such that np.dot(y, w) is equal to simps(y, dx=h). As in simps,
+    for an even number of points the result is the average of the two
+    ways of closing the last interval with the trapezoidal rule.
+
+    With the weights, a block of files is integrated in a single
+    matrix-vector product, without the temporary arrays of simps.
+    '''
+    def _odd(m):
+        w = np.ones(m)
+        w[1:-1:2] = 4.
+        w[2:-1:2] = 2.
+        return w * h / 3.
+
+    if n % 2 == 1:
+        return _odd(n)
+    w = np.zeros(n)
+    w[:-1] += _odd(n-1)
+    w[1:] += _odd(n-1)
+    w[[0, 1, -2, -1]] += 0.5 * h
+    return w * 0.5
+
+
+def _check_dgdl(ndata, tlast, lambda0):
+    '''Prints some info about the longest dgdl.xvg file.'''
     dlambda = 1./float(ndata)
     if lambda0 == 1:
         dlambda *= -1
 
     print('    # data points: %d' % ndata)
-    print('    Length of trajectory: %8.3f ps' % r[-1][0])
+    print('    Length of trajectory: %8.3f ps' % tlast)
     print('    Delta lambda: %8.5f' % dlambda)
 
 
 def _dump_integ_file(outfn, f_lst, w_lst):
+    line = '{dhdl} {work}\n'.format
     with open(outfn, 'w') as f:
-        for fn, w in zip(f_lst, w_lst):
-            f.write('{dhdl} {work}\n'.format(dhdl=fn, work=w))
+        f.write(''.join([line(dhdl=fn, work=w) for fn, w in zip(f_lst, w_lst)]))
+
+
+def _dump_pickle(obj, fn):
+    with open(fn, 'wb') as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
 
 
 def _data_from_file(fn):
-    data = read_and_format(fn, 'sf')
-    return map(lambda a: a[1], data)
+    # integrated work file: file name and work value on each line
+    with open(fn) as f:
+        lines = [l for l in f.readlines() if l.strip()]
+    if not any('#' in l for l in lines):
+        try:
+            return _xvg_column([l.split(None, 1)[1] for l in lines], col=0,
+                               strict=True)
+        except (ValueError, IndexError):
+            pass
+    # inline comments or malformed lines: parse and check them as before
+    return np.array([a[1] for a in read_and_format(fn, 'sf')])
+
+
+def _xvg_column(lines, col=1, strict=False):
+    '''Parses a column of a table of numbers (e.g. the data lines of a xvg
+    file) with the C parser of numpy, instead of converting each field
+    in Python.
+
+    Parameters
+    ----------
+    lines : list
+        data lines, comments already removed.
+    col : int, optional
+        index of the column to return. Default is 1.
+    strict : bool, optional
+        whether all lines need to have the same number of fields. If False,
+        a table with lines of different lengths (e.g. a truncated last line)
+        is read line by line, and only column col needs to be present in
+        every line. Default is False.
+
+    Returns
+    -------
+    y : array
+        array with the values in column col.
+
+    Raises
+    ------
+    ValueError
+        if a line is incomplete or contains a field that is not a number.
+    '''
+    if not lines:
+        return np.array([])
+    ncol = len(lines[0].split())
+    with warnings.catch_warnings():
+        # a field that is not a number stops the parsing with a warning,
+        # this is caught below by the check on the number of values read
+        warnings.simplefilter('ignore', DeprecationWarning)
+        data = np.fromstring(' '.join(lines), sep=' ')
+    if ncol > col and data.size == ncol*len(lines):
+        return data.reshape(len(lines), ncol)[:, col]
+    if strict:
+        raise ValueError('incomplete table of values')
+    # the number of fields differs between the lines: read column col of
+    # each line, as float(line.split()[col])
+    try:
+        return np.array([float(l.split()[col]) for l in lines])
+    except IndexError:
+        raise ValueError('incomplete table of values')
 
 
 # ------------------
@@ -250,16 +608,17 @@ def plot_work_dist(wf, wr, fname='Wdist.png', nbins=20, dG=None, dGerr=None,
                    units='kJ/mol', dpi=300, statesProvided='AB'):
 
     from matplotlib import pyplot as plt
+    from pmx.estimators import data2gauss
 
     '''Plots forward and reverse work distributions. Optionally, it adds the
     estimate of the free energy change and its uncertainty on the plot.
 
     Parameters
     ----------
-    wf : list
-        list of forward work values.
-    wr : list
-        list of reverse work values.
+    wf : array_like
+        array of forward work values.
+    wr : array_like
+        array of reverse work values.
     fname : str, optional
         filename of the saved image. Default is 'Wdist.png'.
     nbins : int, optional
@@ -321,8 +680,8 @@ def plot_work_dist(wf, wr, fname='Wdist.png', nbins=20, dG=None, dGerr=None,
         mb, devb, Ab = data2gauss(wr)
 
     if 'AB' in statesProvided: 
-        mini = min(wf+wr)
-        maxi = max(wf+wr)
+        mini = min(np.min(wf), np.min(wr))
+        maxi = max(np.max(wf), np.max(wr))
         sm1 = smooth(np.array(wf))
         sm2 = smooth(np.array(wr))
         plt.plot(x1, wf, 'g-', linewidth=2, label="Forward (0->1)", alpha=.3)
@@ -401,15 +760,44 @@ def plot_work_dist(wf, wr, fname='Wdist.png', nbins=20, dG=None, dGerr=None,
 # ---------------------
 # Some helper functions
 # ---------------------
+def _report_templates(prec, units):
+    '''Returns the templates of the report lines for the given precision
+    and units.'''
+    return dict((k, t.replace('{p}', str(prec)).replace('{u}', units))
+                for k, t in _REPORT_LINES.items())
+
+
+def _in_units(estimator, attrs, unit_fact):
+    '''Returns a dictionary with the results of an estimator converted to
+    the output units. Attributes that were not calculated are skipped.'''
+    return dict((a, getattr(estimator, a) * unit_fact) for a in attrs
+                if hasattr(estimator, a))
+
+
 def _tee(fp, s):
     print(s, file=fp)
     print(s)
 
 
+def _glob_files(pattern):
+    '''Returns the files matching a pattern, exits if there is none.'''
+    files = glob.glob(pattern)
+    if not files:
+        exit('No files matching %s' % pattern)
+    return files
+
+
+_NATSORT_RE = re.compile('([0-9]+)')
+
+
 def natural_sort(l):
-    convert = lambda text: int(text) if text.isdigit() else text.lower()
-    alphanum_key = lambda key: [convert(c) for c in re.split('([0-9]+)', key)]
-    return sorted(l, key=alphanum_key)
+    # decorate-sort-undecorate: the keys are built once per item, and the
+    # position in the input keeps the sort stable for identical keys
+    keyed = [([int(c) if c.isdigit() else c.lower()
+               for c in _NATSORT_RE.split(x)], i, x)
+             for i, x in enumerate(l)]
+    keyed.sort()
+    return [x for _, _, x in keyed]
 
 
 def time_stats(seconds):
@@ -449,6 +837,21 @@ def parse_options():
                         'wildcard to select multiple xvg files: e.g. "-fB '
                         './backward_results/dgdl*.xvg"',
                         nargs='+')
+    parser.add_argument('--fA_glob',
+                        metavar='pattern',
+                        dest='globAB',
+                        type=str,
+                        help='Pattern of the dgdl.xvg files for the A->B '
+                        'simulations, expanded by the script rather than by '
+                        'the shell. Use it instead of -fA when the number of '
+                        'files is too large for the command line; quote the '
+                        'pattern: e.g. --fA_glob "./forward_results/dgdl*.xvg"')
+    parser.add_argument('--fB_glob',
+                        metavar='pattern',
+                        dest='globBA',
+                        type=str,
+                        help='Pattern of the dgdl.xvg files for the B->A '
+                        'simulations, see --fA_glob.')
     parser.add_argument('-m',
                         metavar='method',
                         type=str.lower,
@@ -478,6 +881,14 @@ def parse_options():
                         'bootstrap estimate of the standard errors. Default '
                         'is 0 (no bootstrap).',
                         default=100)
+    parser.add_argument('--seed',
+                        metavar='seed',
+                        dest='seed',
+                        type=int,
+                        help='Seed for the random number generator used for '
+                        'the bootstrap and --rand, so that the results can be '
+                        'reproduced. Default is None (random seed).',
+                        default=None)
     parser.add_argument('-n',
                         metavar='nblocks',
                         dest='nblocks',
@@ -530,6 +941,23 @@ def parse_options():
                         'for the reverse (B->A) tranformation. Default is '
                         '"integB.dat"',
                         default='integB.dat')
+    parser.add_argument('-np',
+                        metavar='nproc',
+                        dest='nproc',
+                        type=int,
+                        help='Number of processes to use for reading and '
+                        'integrating the dhdl.xvg files, and for running the '
+                        'estimators. Default is 1.',
+                        default=1)
+    parser.add_argument('--cache',
+                        metavar='cache',
+                        dest='cache',
+                        type=str,
+                        help='npz file where the integrated work values are '
+                        'cached, so that unchanged dhdl.xvg files are not '
+                        'read again in later runs. Default is None (no '
+                        'cache).',
+                        default=None)
     parser.add_argument('--reverseB',
                         dest='reverseB',
                         help='Whether to reverse the work values for the '
@@ -655,7 +1083,13 @@ def main(args):
     filesAB = []
     filesBA = []
     statesProvided = 'AB'
-    out = open(args.outfn, 'w')
+    # line buffered: the report is kept up to the last line written if the
+    # analysis fails
+    out = open(args.outfn, 'w', 1)
+    if args.globAB is not None:
+        args.filesAB = (args.filesAB or []) + _glob_files(args.globAB)
+    if args.globBA is not None:
+        args.filesBA = (args.filesBA or []) + _glob_files(args.globBA)
     if (args.iA is None) and (args.iB is None):
         if (args.filesAB is None) and (args.filesBA is None):
             exit('Need to provide dhdl.xvg files or integrated work values')
@@ -685,6 +1119,7 @@ def main(args):
     nboots = args.nboots
     nblocks = args.nblocks
     do_ks_test = args.do_ks_test
+    rng = np.random.RandomState(args.seed)
 
     # -------------------
     # Select output units
@@ -702,6 +1137,7 @@ def main(args):
         units = 'kT'
     else:
         exit('No unit type \'%s\' available' % units)
+    tpl = _report_templates(prec, units)
 
     print("# analyze_crooks.py, pmx version = %s" % args.pmx_version, file=out)
     print("# pwd = %s" % os.getcwd(), file=out)
@@ -718,10 +1154,14 @@ def main(args):
         # If random selection is chosen, do this before reading files and
         # calculating the work values.
         if args.rand is not None:
+            # draw indices rather than the file names: the sampling works on
+            # integers and the selection stays a list of names
             if 'A' in statesProvided:
-                filesAB = np.random.choice(filesAB, size=args.rand, replace=False)
+                idx = rng.choice(len(filesAB), size=args.rand, replace=False)
+                filesAB = [filesAB[i] for i in idx]
             if 'B' in statesProvided:
-                filesBA = np.random.choice(filesBA, size=args.rand, replace=False)
+                idx = rng.choice(len(filesBA), size=args.rand, replace=False)
+                filesBA = [filesBA[i] for i in idx]
             _tee(out, 'Selected random subset of %d trajectories.' % args.rand)
 
         # If slice values provided, select the files needed. Again before
@@ -740,16 +1180,20 @@ def main(args):
         # If index values provided, select the files needed
         if args.index is not None:
             # Avoid index out of range error if "wrong" indices are provided
+            # (the mask is computed on the lengths before the selection)
+            idx = np.asarray(args.index, dtype=np.intp)
+            maskA = idx < len(filesAB)
+            maskB = idx < len(filesBA)
             if 'A' in statesProvided:
-                filesAB = [filesAB[i] for i in args.index if i < len(filesAB)]
+                filesAB = [filesAB[i] for i in idx[maskA]]
             if 'B' in statesProvided:
-                filesBA = [filesBA[i] for i in args.index if i < len(filesBA)]
+                filesBA = [filesBA[i] for i in idx[maskB]]
             # ...but warn if this happens
-            if any(i > (len(filesAB) - 1) for i in args.index):
+            if 'A' in statesProvided and not maskA.all():
                 print('\nWARNING: index out of range for some of your chosen '
                       '\nindices for the forward work values. This means you are'
                       '\ntrying to select input files that are not present.')
-            if any(i > (len(filesBA) - 1) for i in args.index):
+            if 'B' in statesProvided and not maskB.all():
                 print('\nWARNING: index out of range for some of your chosen'
                       '\nindices for the reverse work values. This means you are'
                       '\ntrying to select input files that are not present.')
@@ -757,9 +1201,9 @@ def main(args):
         # when skipping start count from end: in this way the last frame is
         # always included, and what can change is the first one
         if 'A' in statesProvided:
-            filesAB = list(reversed(filesAB[::-skip]))
+            filesAB = filesAB[(len(filesAB) - 1) % skip::skip]
         if 'B' in statesProvided:
-            filesBA = list(reversed(filesBA[::-skip]))
+            filesBA = filesBA[(len(filesBA) - 1) % skip::skip]
 
         # --------------------
         # Now read in the data
@@ -769,14 +1213,27 @@ def main(args):
         print(' ========================================================')
         res_ab = []
         res_ba = []
+        cache = None
+        if args.cache is not None:
+            cache = load_work_cache(args.cache)
         if 'A' in statesProvided:
             print('  Forward Data')
-            res_ab = parse_dgdl_files(filesAB, lambda0=0,invert_values=False)
+            res_ab = parse_dgdl_files(filesAB, lambda0=0,invert_values=False,
+                                      nproc=args.nproc, cache=cache)
             _dump_integ_file(args.oA, filesAB, res_ab)
         if 'B' in statesProvided:
             print('  Reverse Data')
-            res_ba = parse_dgdl_files(filesBA, lambda0=1,invert_values=reverseB)
+            res_ba = parse_dgdl_files(filesBA, lambda0=1,invert_values=reverseB,
+                                      nproc=args.nproc, cache=cache)
             _dump_integ_file(args.oB, filesBA, res_ba)
+        if cache is not None:
+            # only the entries of the files analysed in this run are kept
+            keys = []
+            if 'A' in statesProvided:
+                keys += [_work_cache_key(f, 0, False) for f in filesAB]
+            if 'B' in statesProvided:
+                keys += [_work_cache_key(f, 1, reverseB) for f in filesBA]
+            save_work_cache(args.cache, cache, keys=keys)
 
     # If work values are given as input instead, read those
     elif args.iA is not None or args.iB is not None:
@@ -784,10 +1241,10 @@ def main(args):
         res_ba = []
         if 'A' in statesProvided:
             print('  Reading integrated values (A->B) from', args.iA)
-            res_ab.extend(_data_from_file(args.iA))
+            res_ab = _data_from_file(args.iA)
         if 'B' in statesProvided:
             print('  Reading integrated values (B->A) from', args.iB)
-            res_ba.extend(_data_from_file(args.iB))
+            res_ba = _data_from_file(args.iB)
         # If slice values provided, select the files needed.
         if args.slice is not None:
             first = args.slice[0]
@@ -808,6 +1265,15 @@ def main(args):
         print('\n    ......done........\n')
         sys.exit(0)
 
+    # the estimators (and scipy) are imported only when the analysis is run
+    from pmx.estimators import Jarz, JarzGauss, Crooks, BAR, ks_norm_test
+    from pmx.estimators import bootstrap_indices
+
+    # the work values are kept in double precision: CGI and the Gaussian
+    # estimates subtract nearly equal numbers and lose digits in float32
+    res_ab = np.asarray(res_ab, dtype=np.float64)
+    res_ba = np.asarray(res_ba, dtype=np.float64)
+
     # ==============
     # Begin Analysis
     # ==============
@@ -820,6 +1286,43 @@ def main(args):
         _tee(out, '  Number of reverse (1->0) trajectories: %d' % len(res_ba))
     _tee(out, '  Temperature : %.2f K' % T)
 
+    # the same bootstrap samples are used by all the estimators
+    boot_idx_f = None
+    boot_idx_r = None
+    if nboots > 0:
+        if 'A' in statesProvided:
+            boot_idx_f = bootstrap_indices(len(res_ab), nboots, rng=rng)
+        if 'B' in statesProvided:
+            boot_idx_r = bootstrap_indices(len(res_ba), nboots, rng=rng)
+    boot_kw = dict(boot_idx_f=boot_idx_f, boot_idx_r=boot_idx_r, rng=rng)
+
+    # the estimators are independent of each other: with -np > 1 they are
+    # started in parallel here, and collected where they are reported
+    tasks = {}
+    if 'cgi' in methods and 'AB' in statesProvided:
+        tasks['cgi'] = (Crooks, (res_ab, res_ba),
+                        dict(nboots=nboots, nblocks=nblocks, **boot_kw))
+    if 'bar' in methods and 'AB' in statesProvided:
+        tasks['bar'] = (BAR, (res_ab, res_ba, T),
+                        dict(nboots=nboots, nblocks=nblocks, **boot_kw))
+    if 'jarz' in methods or 'AB' not in statesProvided:
+        for name, est in [('jarz', Jarz), ('jarz_gauss', JarzGauss)]:
+            tasks[name] = (est, (res_ab, res_ba, T),
+                           dict(nboots=nboots, nblocks=nblocks,
+                                statesProvided=statesProvided, **boot_kw))
+    pool = None
+    if args.nproc > 1 and len(tasks) > 1:
+        pool = Pool(processes=min(args.nproc, len(tasks)))
+        for name, (est, est_args, est_kw) in tasks.items():
+            tasks[name] = pool.apply_async(est, est_args, est_kw)
+        pool.close()
+
+    def estimate(name):
+        if pool is not None:
+            return tasks[name].get()
+        est, est_args, est_kw = tasks[name]
+        return est(*est_args, **est_kw)
+
     # ============================
     # Crooks Gaussian Intersection
     # ============================
@@ -829,35 +1332,27 @@ def main(args):
         _tee(out, ' --------------------------------------------------------')
 
         print('  Calculating Intersection...')
-        cgi = Crooks(wf=res_ab, wr=res_ba, nboots=nboots, nblocks=nblocks)
+        cgi = estimate('cgi')
         if args.pickle is True:
-            pickle.dump(cgi, open("cgi_results.pkl", "wb"))
+            _dump_pickle(cgi, "cgi_results.pkl")
+        cgi_vals = _in_units(cgi, ['mf', 'devf', 'mr', 'devr', 'dg', 'err_boot1',
+                                   'err_boot2', 'err_blocks'], unit_fact)
 
-        _tee(out, '  CGI: Forward Gauss mean = {m:8.{p}f} {u} '
-                  'std = {s:8.{p}f} {u}'.format(m=cgi.mf*unit_fact,
-                                                s=cgi.devf*unit_fact,
-                                                p=prec, u=units))
-        _tee(out, '  CGI: Reverse Gauss mean = {m:8.{p}f} {u} '
-                  'std = {s:8.{p}f} {u}'.format(m=cgi.mr*unit_fact,
-                                                s=cgi.devr*unit_fact,
-                                                p=prec, u=units))
+        _tee(out, tpl['cgi_mf'].format(m=cgi_vals['mf'], s=cgi_vals['devf']))
+        _tee(out, tpl['cgi_mr'].format(m=cgi_vals['mr'], s=cgi_vals['devr']))
 
         if cgi.inters_bool is False:
             _tee(out, '\n  Gaussians too close for intersection calculation')
             _tee(out, '   --> Taking difference of mean values')
 
-        _tee(out, '  CGI: dG = {dg:8.{p}f} {u}'.format(dg=cgi.dg*unit_fact,
-                                                       p=prec, u=units))
-        _tee(out, '  CGI: Std Err (bootstrap:parametric) = {e:8.{p}f} {u}'.format(e=cgi.err_boot1*unit_fact,
-                                                                                  p=prec, u=units))
+        _tee(out, tpl['cgi_dg'].format(dg=cgi_vals['dg']))
+        _tee(out, tpl['cgi_err_boot1'].format(e=cgi_vals['err_boot1']))
 
         if nboots > 0:
-            _tee(out, '  CGI: Std Err (bootstrap) = {e:8.{p}f} {u}'.format(e=cgi.err_boot2*unit_fact,
-                                                                           p=prec, u=units))
+            _tee(out, tpl['cgi_err_boot2'].format(e=cgi_vals['err_boot2']))
 
         if nblocks > 1:
-            _tee(out, '  CGI: Std Err (blocks) = {e:8.{p}f} {u}'.format(e=cgi.err_blocks*unit_fact,
-                                                                        p=prec, u=units))
+            _tee(out, tpl['cgi_err_blocks'].format(e=cgi_vals['err_blocks']))
 
     # --------------
     # Normality test
@@ -890,17 +1385,19 @@ def main(args):
 
         print('  Running Nelder-Mead Simplex algorithm... ')
 
-        bar = BAR(res_ab, res_ba, T=T, nboots=nboots, nblocks=nblocks)
+        bar = estimate('bar')
         if args.pickle:
-            pickle.dump(bar, open("bar_results.pkl", "wb"))
+            _dump_pickle(bar, "bar_results.pkl")
+        bar_vals = _in_units(bar, ['dg', 'err', 'err_boot', 'err_blocks'],
+                             unit_fact)
 
-        _tee(out, '  BAR: dG = {dg:8.{p}f} {u}'.format(dg=bar.dg*unit_fact, p=prec, u=units))
-        _tee(out, '  BAR: Std Err (analytical) = {e:8.{p}f} {u}'.format(e=bar.err*unit_fact, p=prec, u=units))
+        _tee(out, tpl['bar_dg'].format(dg=bar_vals['dg']))
+        _tee(out, tpl['bar_err'].format(e=bar_vals['err']))
 
         if nboots > 0:
-            _tee(out, '  BAR: Std Err (bootstrap)  = {e:8.{p}f} {u}'.format(e=bar.err_boot*unit_fact, p=prec, u=units))
+            _tee(out, tpl['bar_err_boot'].format(e=bar_vals['err_boot']))
         if nblocks > 1:
-            _tee(out, '  BAR: Std Err (blocks)  = {e:8.{p}f} {u}'.format(e=bar.err_blocks*unit_fact, p=prec, u=units))
+            _tee(out, tpl['bar_err_blocks'].format(e=bar_vals['err_blocks']))
 
         _tee(out, '  BAR: Conv = %8.2f' % bar.conv)
 
@@ -915,70 +1412,66 @@ def main(args):
         _tee(out, '             Jarzynski estimator     ')
         _tee(out, ' --------------------------------------------------------')
 
-        jarz = Jarz(wf=res_ab, wr=res_ba, T=T, nboots=nboots, nblocks=nblocks, statesProvided=statesProvided)
+        jarz = estimate('jarz')
         if args.pickle:
-            pickle.dump(jarz, open("jarz_results.pkl", "wb"))
+            _dump_pickle(jarz, "jarz_results.pkl")
+        jarz_vals = _in_units(jarz, ['dg_for', 'dg_rev', 'dg_mean',
+                                     'err_boot_for', 'err_boot_rev',
+                                     'err_blocks_for', 'err_blocks_rev'],
+                              unit_fact)
 
         if 'A' in statesProvided:
-            _tee(out, '  JARZ: dG Forward = {dg:8.{p}f} {u}'.format(dg=jarz.dg_for*unit_fact,
-                                                                p=prec, u=units))
+            _tee(out, tpl['jarz_dg_for'].format(dg=jarz_vals['dg_for']))
         if 'B' in statesProvided:
-            _tee(out, '  JARZ: dG Reverse = {dg:8.{p}f} {u}'.format(dg=jarz.dg_rev*unit_fact,
-                                                                p=prec, u=units))
+            _tee(out, tpl['jarz_dg_rev'].format(dg=jarz_vals['dg_rev']))
         if 'AB' in statesProvided:
-            _tee(out, '  JARZ: dG Mean    = {dg:8.{p}f} {u}'.format(dg=jarz.dg_mean*unit_fact,
-                                                                p=prec, u=units))
+            _tee(out, tpl['jarz_dg_mean'].format(dg=jarz_vals['dg_mean']))
         if nboots > 0:
             if 'A' in statesProvided:
-                _tee(out, '  JARZ: Std Err Forward (bootstrap) = {e:8.{p}f} {u}'.format(e=jarz.err_boot_for*unit_fact,
-                                                                                    p=prec, u=units))
+                _tee(out, tpl['jarz_err_boot_for'].format(e=jarz_vals['err_boot_for']))
             if 'B' in statesProvided:
-                _tee(out, '  JARZ: Std Err Reverse (bootstrap) = {e:8.{p}f} {u}'.format(e=jarz.err_boot_rev*unit_fact,
-                                                                                    p=prec, u=units))
+                _tee(out, tpl['jarz_err_boot_rev'].format(e=jarz_vals['err_boot_rev']))
 
         if nblocks > 1:
 	    if 'A' in statesProvided:
-                _tee(out, '  JARZ: Std Err Forward (blocks) = {e:8.{p}f} {u}'.format(e=jarz.err_blocks_for*unit_fact,
-                                                                                 p=prec, u=units))
+                _tee(out, tpl['jarz_err_blocks_for'].format(e=jarz_vals['err_blocks_for']))
             if 'B' in statesProvided:
-                _tee(out, '  JARZ: Std Err Reverse (blocks) = {e:8.{p}f} {u}'.format(e=jarz.err_blocks_rev*unit_fact,
-                                                                                 p=prec, u=units))
+                _tee(out, tpl['jarz_err_blocks_rev'].format(e=jarz_vals['err_blocks_rev']))
 
 
         # -------------------------------------
         # Jarzynski with Gaussian approximation
         # -------------------------------------
         print('Running Jarzynski Gaussian approximation analysis...')
-        jarzGauss = JarzGauss(wf=res_ab, wr=res_ba, T=T, nboots=nboots, nblocks=nblocks, statesProvided=statesProvided)
+        jarzGauss = estimate('jarz_gauss')
         if args.pickle:
-            pickle.dump(jarzGauss, open("jarz_gauss_results.pkl", "wb"))
+            _dump_pickle(jarzGauss, "jarz_gauss_results.pkl")
+        jarzg_vals = _in_units(jarzGauss, ['dg_for', 'dg_rev', 'err_for',
+                                           'err_rev', 'err_boot_for',
+                                           'err_boot_rev', 'err_blocks_for',
+                                           'err_blocks_rev'], unit_fact)
 
 	if 'A' in statesProvided:
-            _tee(out, '  JARZ_Gauss: dG Forward = {dg:8.{p}f} {u}'.format(dg=jarzGauss.dg_for*unit_fact,
-                                                                    p=prec, u=units))
+            _tee(out, tpl['jarz_gauss_dg_for'].format(dg=jarzg_vals['dg_for']))
 	if 'B' in statesProvided:
-            _tee(out, '  JARZ_Gauss: dG Reverse = {dg:8.{p}f} {u}'.format(dg=jarzGauss.dg_rev*unit_fact,
-                                                                    p=prec, u=units))
+            _tee(out, tpl['jarz_gauss_dg_rev'].format(dg=jarzg_vals['dg_rev']))
 	if 'AB' in statesProvided:
-            _tee(out, '  JARZ_Gauss: dG Mean    = {dg:8.{p}f} {u}'.format(dg=(jarzGauss.dg_for+jarzGauss.dg_rev)/2.0*unit_fact,
-                                                                    p=prec, u=units))
+            _tee(out, tpl['jarz_gauss_dg_mean'].format(dg=(jarzg_vals['dg_for']+jarzg_vals['dg_rev'])/2.0))
 	if 'A' in statesProvided:
-            _tee(out, '  JARZ_Gauss: Std Err (analytical) Forward = {dg:8.{p}f} {u}'.format(dg=jarzGauss.err_for*unit_fact,
-                                                                    p=prec, u=units))
+            _tee(out, tpl['jarz_gauss_err_for'].format(dg=jarzg_vals['err_for']))
 	if 'B' in statesProvided:
-            _tee(out, '  JARZ_Gauss: Std Err (analytical) Reverse = {dg:8.{p}f} {u}'.format(dg=jarzGauss.err_rev*unit_fact,
-                                                                    p=prec, u=units))
+            _tee(out, tpl['jarz_gauss_err_rev'].format(dg=jarzg_vals['err_rev']))
         if nboots > 0:
 	    if 'A' in statesProvided:
-                _tee(out, '  JARZ_Gauss: Std Err Forward (bootstrap) = {e:8.{p}f} {u}'.format(e=jarzGauss.err_boot_for*unit_fact, p=prec, u=units))
+                _tee(out, tpl['jarz_gauss_err_boot_for'].format(e=jarzg_vals['err_boot_for']))
 	    if 'B' in statesProvided:
-                _tee(out, '  JARZ_Gauss: Std Err Reverse (bootstrap) = {e:8.{p}f} {u}'.format(e=jarzGauss.err_boot_rev*unit_fact,p=prec, u=units))
+                _tee(out, tpl['jarz_gauss_err_boot_rev'].format(e=jarzg_vals['err_boot_rev']))
 
         if nblocks > 1:
 	    if 'A' in statesProvided:
-                _tee(out, '  JARZ_Gauss: Std Err Forward (blocks) = {e:8.{p}f} {u}'.format(e=jarzGauss.err_blocks_for*unit_fact,p=prec, u=units))
+                _tee(out, tpl['jarz_gauss_err_blocks_for'].format(e=jarzg_vals['err_blocks_for']))
             if 'B' in statesProvided:
-                _tee(out, '  JARZ_Gauss: Std Err Reverse (blocks) = {e:8.{p}f} {u}'.format(e=jarzGauss.err_blocks_rev*unit_fact,p=prec, u=units))
+                _tee(out, tpl['jarz_gauss_err_blocks_rev'].format(e=jarzg_vals['err_blocks_rev']))
 
     _tee(out, ' ========================================================')
 
@@ -989,25 +1482,25 @@ def main(args):
         print('\n   Plotting histograms......')
         # hierarchy of estimators: BAR > Crooks > Jarz
         if 'bar' in locals():
-            show_dg = bar.dg * unit_fact
+            show_dg = bar_vals['dg']
             # hierarchy of error estimates : blocks > boots > analytical
             if hasattr(bar, 'err_blocks'):
-                show_err = bar.err_blocks * unit_fact
+                show_err = bar_vals['err_blocks']
             elif hasattr(bar, 'err_boot') and not hasattr(bar, 'err_blocks'):
-                show_err = bar.err_boot * unit_fact
+                show_err = bar_vals['err_boot']
             else:
-                show_err = bar.err * unit_fact
+                show_err = bar_vals['err']
             # plot
             plot_work_dist(fname=args.wplot, wf=res_ab, wr=res_ba, dG=show_dg,
                            dGerr=show_err, nbins=args.nbins, dpi=args.dpi,
                            units=units)
         elif 'bar' not in locals() and 'cgi' in locals():
-            show_dg = cgi.dg * unit_fact
+            show_dg = cgi_vals['dg']
             # hierarchy of error estimates : blocks > boots
             if hasattr(cgi, 'err_blocks'):
-                show_err = cgi.err_blocks * unit_fact
+                show_err = cgi_vals['err_blocks']
             elif hasattr(cgi, 'err_boot2') and not hasattr(cgi, 'err_blocks'):
-                show_err = cgi.err_boot2 * unit_fact
+                show_err = cgi_vals['err_boot2']
             else:
                 show_err = None
             # plot
@@ -1017,11 +1510,11 @@ def main(args):
         elif 'bar' not in locals() and 'cgi' not in locals() and 'jarz' in locals():
             # for the moment, show values only under specific circumstances
             if hasattr(jarz, 'dg_mean'):
-                show_dg = jarz.dg_mean * unit_fact
+                show_dg = jarz_vals['dg_mean']
             elif 'A' in statesProvided:
-                show_dg = jarz.dg_for
+                show_dg = jarz_vals['dg_for']
             elif 'B' in statesProvided:
-                show_dg = jarz.dg_rev
+                show_dg = jarz_vals['dg_rev']
             else:
                 show_dg = None
             show_err = None
@@ -1030,6 +1523,9 @@ def main(args):
                            dGerr=show_err, nbins=args.nbins, dpi=args.dpi,
                            units=units,statesProvided=statesProvided)
 
+    if pool is not None:
+        pool.join()
+
     print('\n   ......done...........\n')
 
     if args.pickle:
@@ -2,348 +2,157 @@ import sys, os
 from pmx import *
 from pmx.ffparser import RTPParser, NBParser
 from pmx.rotamer import _aa_chi
-from pmx.parser import kickOutComments, readSection, parseList
-import tempfile
-
-standard_pair_list = [
-    ('N','N'),
-    ('H','H'),
-    ('CA','CA'),
-    ('C','C'),
-    ('O','O'),
-    ('HA','HA'),
-    ('CB','CB'),
-    ('1HB','1HB'),
-    ('2HB','2HB'),
-    ('CG','CG')
-    ]
-
-standard_pair_list_charmm = [
-    ('N','N'),
-    ('HN','HN'),
-    ('CA','CA'),
-    ('C','C'),
-    ('O','O'),
-    ('HA','HA'),
-    ('CB','CB'),
-    ('1HB','1HB'),
-    ('2HB','2HB'),
-    ('CG','CG')
-    ]
-
-standard_pair_listB = [
-    ('N','N'),
-    ('H','H'),
-    ('CA','CA'),
-    ('C','C'),
-    ('O','O'),
-    ('HA','HA'),
-    ('CB','CB'),
-    ('1HB','1HB'),
-    ('2HB','2HB')
-    ]
-
-standard_pair_list_charmmB = [
-    ('N','N'),
-    ('HN','HN'),
-    ('CA','CA'),
-    ('C','C'),
-    ('O','O'),
-    ('HA','HA'),
-    ('CB','CB'),
-    ('1HB','1HB'),
-    ('2HB','2HB')
-    ]
-
-standard_pair_listC = [
-    ('N','N'),
-    ('H','H'),
-    ('CA','CA'),
-    ('C','C'),
-    ('O','O'),
-    ('HA','HA'),
-    ('CB','CB')
-    ]
-
-standard_pair_list_charmmC = [
-    ('N','N'),
-    ('HN','HN'),
-    ('CA','CA'),
-    ('C','C'),
-    ('O','O'),
-    ('HA','HA'),
-    ('CB','CB')
-    ]
-
-standard_pair_listD = [
-    ('N','N'),
-    ('H','H'),
-    ('CA','CA'),
-    ('C','C'),
-    ('O','O')
-    ]
-
-standard_pair_list_charmmD = [
-    ('N','N'),
-    ('HN','HN'),
-    ('CA','CA'),
-    ('C','C'),
-    ('O','O')
-    ]
-
-standard_rna_pair_list = [
-    ('C1\'','C1\''),
-    ('C2\'','C2\''),
-    ('C3\'','C3\''),
-    ('C4\'','C4\''),
-    ('O4\'','O4\''),
-    ('C5\'','C5\''),
-    ('O5\'','O5\''),
-    ('H1\'','H1\''),
-    ('H2\'1','H2\'1'),
-    ('O2\'','O2\''),
-    ('HO\'2','HO\'2'),
-    ('O3\'','O3\''),
-    ('H3\'','H3\''),
-    ('H4\'','H4\''),
-    ('H5\'1','H5\'1'),
-    ('H5\'2','H5\'2'),
-    ('P','P'),
-    ('O1P','O1P'),
-    ('O2P','O2P'),
-    ]
-    
-standard_rna_5term_pair_list = [
-    ('C1\'','C1\''),
-    ('C2\'','C2\''),
-    ('C3\'','C3\''),
-    ('C4\'','C4\''),
-    ('O4\'','O4\''),
-    ('C5\'','C5\''),
-    ('O5\'','O5\''),
-    ('H1\'','H1\''),
-    ('H2\'1','H2\'1'),
-    ('O2\'','O2\''),
-    ('HO\'2','HO\'2'),
-    ('O3\'','O3\''),
-    ('H3\'','H3\''),
-    ('H4\'','H4\''),
-    ('H5\'1','H5\'1'),
-    ('H5\'2','H5\'2'),
-    ('H5T','H5T'),
-    ]
-
-standard_rna_3term_pair_list = [
-    ('C1\'','C1\''),
-    ('C2\'','C2\''),
-    ('C3\'','C3\''),
-    ('C4\'','C4\''),
-    ('O4\'','O4\''),
-    ('C5\'','C5\''),
-    ('O5\'','O5\''),
-    ('H1\'','H1\''),
-    ('H2\'1','H2\'1'),
-    ('O2\'','O2\''),
-    ('HO\'2','HO\'2'),
-    ('O3\'','O3\''),
-    ('H3T','H3T'),
-    ('H3\'','H3\''),
-    ('H4\'','H4\''),
-    ('H5\'1','H5\'1'),
-    ('H5\'2','H5\'2'),
-    ('P','P'),
-    ('O1P','O1P'),
-    ('O2P','O2P'),
-    ]
-
-standard_dna_pair_list = [
-    ('C1\'','C1\''),
-    ('C2\'','C2\''),
-    ('C3\'','C3\''),
-    ('C4\'','C4\''),
-    ('O4\'','O4\''),
-    ('C5\'','C5\''),
-    ('O5\'','O5\''),
-    ('H1\'','H1\''),
-    ('H2\'1','H2\'1'),
-    ('H2\'2','H2\'2'),
-    ('O3\'','O3\''),
-    ('H3\'','H3\''),
-    ('H4\'','H4\''),
-    ('H5\'1','H5\'1'),
-    ('H5\'2','H5\'2'),
-    ('P','P'),
-    ('O1P','O1P'),
-    ('O2P','O2P'),
-    ]
-    
-standard_dna_5term_pair_list = [
-    ('C1\'','C1\''),
-    ('C2\'','C2\''),
-    ('C3\'','C3\''),
-    ('C4\'','C4\''),
-    ('O4\'','O4\''),
-    ('C5\'','C5\''),
-    ('O5\'','O5\''),
-    ('H1\'','H1\''),
-    ('H2\'1','H2\'1'),
-    ('H2\'2','H2\'2'),
-    ('O3\'','O3\''),
-    ('H3\'','H3\''),
-    ('H4\'','H4\''),
-    ('H5\'1','H5\'1'),
-    ('H5\'2','H5\'2'),
-    ('H5T','H5T'),
-    ]
-
-standard_dna_3term_pair_list = [
-    ('C1\'','C1\''),
-    ('C2\'','C2\''),
-    ('C3\'','C3\''),
-    ('C4\'','C4\''),
-    ('O4\'','O4\''),
-    ('C5\'','C5\''),
-    ('O5\'','O5\''),
-    ('H1\'','H1\''),
-    ('H2\'1','H2\'1'),
-    ('H2\'2','H2\'2'),
-    ('O3\'','O3\''),
-    ('H3T','H3T'),
-    ('H3\'','H3\''),
-    ('H4\'','H4\''),
-    ('H5\'1','H5\'1'),
-    ('H5\'2','H5\'2'),
-    ('P','P'),
-    ('O1P','O1P'),
-    ('O2P','O2P'),
-    ]
-
-standard_dna_pair_list_charmm = [
-    ('C1\'','C1\''),
-    ('C2\'','C2\''),
-    ('C3\'','C3\''),
-    ('C4\'','C4\''),
-    ('O4\'','O4\''),
-    ('C5\'','C5\''),
-    ('O5\'','O5\''),
-    ('H1\'','H1\''),
-    ('H2\'','H2\''),
-    ('H2\'\'','H2\'\''),
-    ('O3\'','O3\''),
-    ('H3\'','H3\''),
-    ('H4\'','H4\''),
-    ('H5\'','H5\''),
-    ('H5\'\'','H5\'\''),
-    ('P','P'),
-    ('O1P','O1P'),
-    ('O2P','O2P'),
-    ]
-    
-standard_dna_5term_pair_list_charmm = [
-    ('C1\'','C1\''),
-    ('C2\'','C2\''),
-    ('C3\'','C3\''),
-    ('C4\'','C4\''),
-    ('O4\'','O4\''),
-    ('C5\'','C5\''),
-    ('O5\'','O5\''),
-    ('H1\'','H1\''),
-    ('H2\'','H2\''),
-    ('H2\'\'','H2\'\''),
-    ('O3\'','O3\''),
-    ('H3\'','H3\''),
-    ('H4\'','H4\''),
-    ('H5\'','H5\''),
-    ('H5\'\'','H5\'\''),
-    ('H5T','H5T'),
-    ]
-
-standard_dna_3term_pair_list_charmm = [
-    ('C1\'','C1\''),
-    ('C2\'','C2\''),
-    ('C3\'','C3\''),
-    ('C4\'','C4\''),
-    ('O4\'','O4\''),
-    ('C5\'','C5\''),
-    ('O5\'','O5\''),
-    ('H1\'','H1\''),
-    ('H2\'','H2\''),
-    ('H2\'\'','H2\'\''),
-    ('O3\'','O3\''),
-    ('H3T','H3T'),
-    ('H3\'','H3\''),
-    ('H4\'','H4\''),
-    ('H5\'','H5\''),
-    ('H5\'\'','H5\'\''),
-    ('P','P'),
-    ('O1P','O1P'),
-    ('O2P','O2P'),
-    ]
-
+from pmx.library import _aa_dihedrals
+from pmx.parser import kickOutComments, parseList
+from collections import OrderedDict
+from itertools import chain
+import numpy as np
+
+# per-atom debug output, set from -verbose
+bVerbose = False
+
+# atoms paired by name: each map keeps the atom names in pairing order,
+# the *_pair_list names are kept (as immutable tuples) for make_predefined_pairs.
+# Names like C1' are not interned by the compiler, do it here once
+def _mk(*names):
+    return OrderedDict([(n, n) for n in map(intern, names)])
+
+# the variants of a family are derived from one canonical tuple of names
+def _derive(names, drop=(), rename={}, insert={}, append=()):
+    out = []
+    for n in names:
+        if n in drop:
+            continue
+        out.append(rename.get(n, n))
+        if insert.has_key(n):
+            out.append(insert[n])
+    return _mk(*(out + list(append)))
+
+def _term5(names, **kwargs):
+    return _derive(names, drop=('P','O1P','O2P'), append=('H5T',), **kwargs)
+
+def _term3(names, **kwargs):
+    return _derive(names, insert={'O3\'':'H3T'}, **kwargs)
+
+# amino acids: main chain + CB (+ CG); CHARMM names the amide H HN
+_aa_names = ('N','H','CA','C','O','HA','CB','1HB','2HB','CG')
+_charmm_aa = {'H':'HN'}
+
+standard_pair_map = _derive(_aa_names)
+standard_pair_map_charmm = _derive(_aa_names, rename=_charmm_aa)
+standard_pair_mapB = _derive(_aa_names[:9])
+standard_pair_map_charmmB = _derive(_aa_names[:9], rename=_charmm_aa)
+standard_pair_mapC = _derive(_aa_names[:7])
+standard_pair_map_charmmC = _derive(_aa_names[:7], rename=_charmm_aa)
+standard_pair_mapD = _derive(_aa_names[:5])
+standard_pair_map_charmmD = _derive(_aa_names[:5], rename=_charmm_aa)
+
+# nucleic acids: sugar + phosphate, the 5' terminus has no phosphate but H5T,
+# the 3' terminus has H3T
+_rna_names = ('C1\'','C2\'','C3\'','C4\'','O4\'','C5\'','O5\'','H1\'',
+              'H2\'1','O2\'','HO\'2','O3\'','H3\'','H4\'','H5\'1','H5\'2',
+              'P','O1P','O2P')
+_dna_names = ('C1\'','C2\'','C3\'','C4\'','O4\'','C5\'','O5\'','H1\'',
+              'H2\'1','H2\'2','O3\'','H3\'','H4\'','H5\'1','H5\'2',
+              'P','O1P','O2P')
+_charmm_dna = {'H2\'1':'H2\'', 'H2\'2':'H2\'\'', 'H5\'1':'H5\'', 'H5\'2':'H5\'\''}
+
+standard_rna_pair_map = _derive(_rna_names)
+standard_rna_5term_pair_map = _term5(_rna_names)
+standard_rna_3term_pair_map = _term3(_rna_names)
+standard_dna_pair_map = _derive(_dna_names)
+standard_dna_5term_pair_map = _term5(_dna_names)
+standard_dna_3term_pair_map = _term3(_dna_names)
+standard_dna_pair_map_charmm = _derive(_dna_names, rename=_charmm_dna)
+standard_dna_5term_pair_map_charmm = _term5(_dna_names, rename=_charmm_dna)
+standard_dna_3term_pair_map_charmm = _term3(_dna_names, rename=_charmm_dna)
+
+standard_pair_list = tuple(standard_pair_map.items())
+standard_pair_list_charmm = tuple(standard_pair_map_charmm.items())
+standard_pair_listB = tuple(standard_pair_mapB.items())
+standard_pair_list_charmmB = tuple(standard_pair_map_charmmB.items())
+standard_pair_listC = tuple(standard_pair_mapC.items())
+standard_pair_list_charmmC = tuple(standard_pair_map_charmmC.items())
+standard_pair_listD = tuple(standard_pair_mapD.items())
+standard_pair_list_charmmD = tuple(standard_pair_map_charmmD.items())
+standard_rna_pair_list = tuple(standard_rna_pair_map.items())
+standard_rna_5term_pair_list = tuple(standard_rna_5term_pair_map.items())
+standard_rna_3term_pair_list = tuple(standard_rna_3term_pair_map.items())
+standard_dna_pair_list = tuple(standard_dna_pair_map.items())
+standard_dna_5term_pair_list = tuple(standard_dna_5term_pair_map.items())
+standard_dna_3term_pair_list = tuple(standard_dna_3term_pair_map.items())
+standard_dna_pair_list_charmm = tuple(standard_dna_pair_map_charmm.items())
+standard_dna_5term_pair_list_charmm = tuple(standard_dna_5term_pair_map_charmm.items())
+standard_dna_3term_pair_list_charmm = tuple(standard_dna_3term_pair_map_charmm.items())
+
+# residue name -> set of residue names it is paired with by the standard
+# pair lists
+_his_targets = frozenset([ 'PHE','TYR','TRP'])
 use_standard_pair_list = {
-    'PHE': [ 'TRP','HIP','HID','HIE','HSP','HSD','HSE','HIS1','HISD','HISH','HISE'],
-    'TYR': [ 'TRP','HIP','HID','HIE','HSP','HSD','HSE','HIS1','HISD','HISH','HISE'],
-    'TRP': [ 'PHE','TYR','HIP','HID','HSE','HSP','HSD','HSE','HIS1','HISD','HISH','HISE','HIE'],
-    'HID': [ 'PHE','TYR','TRP'], #[ 'PHE','TYR','HIP','TRP','HIE'],
-    'HIE': [ 'PHE','TYR','TRP'], #[ 'PHE','TYR','HIP','HID','TRP'],
-    'HIP': [ 'PHE','TYR','TRP'], #,'HID','HIE'],
-    'HSD': [ 'PHE','TYR','TRP'], #[ 'PHE','TYR','HIP','TRP','HIE'],
-    'HSE': [ 'PHE','TYR','TRP'], #[ 'PHE','TYR','HIP','HID','TRP'],
-    'HSP': [ 'PHE','TYR','TRP'], #,'HID','HIE'],
-    'HIS1': [ 'TRP','PHE','TYR'],
-    'HISD': [ 'TRP','PHE','TYR'],
-    'HISE': [ 'TRP','PHE','TYR'],
-    'HISH': [ 'TRP','PHE','TYR']
+    'PHE': frozenset([ 'TRP','HIP','HID','HIE','HSP','HSD','HSE','HIS1','HISD','HISH','HISE']),
+    'TYR': frozenset([ 'TRP','HIP','HID','HIE','HSP','HSD','HSE','HIS1','HISD','HISH','HISE']),
+    'TRP': frozenset([ 'PHE','TYR','HIP','HID','HSP','HSD','HSE','HIS1','HISD','HISH','HISE','HIE']),
     }
+# all histidine variants pair with the aromatics only, not with each other
+use_standard_pair_list.update( dict.fromkeys(
+    ['HID','HIE','HIP','HSD','HSE','HSP','HIS1','HISD','HISE','HISH'], _his_targets) )
 
 use_standard_rna_pair_list = {
-    'RA': [ 'RC','RU'],
-    'RG': [ 'RC','RU'],
-    'RC': [ 'RA','RG'],
-    'RU': [ 'RA','RG'],
+    'RA': frozenset([ 'RC','RU']),
+    'RG': frozenset([ 'RC','RU']),
+    'RC': frozenset([ 'RA','RG']),
+    'RU': frozenset([ 'RA','RG']),
     }
 
 use_standard_rna_5term_pair_list = {
-    'RA5': [ 'RC5','RU5'],
-    'RG5': [ 'RC5','RU5'],
-    'RC5': [ 'RA5','RG5'],
-    'RU5': [ 'RA5','RG5'],
+    'RA5': frozenset([ 'RC5','RU5']),
+    'RG5': frozenset([ 'RC5','RU5']),
+    'RC5': frozenset([ 'RA5','RG5']),
+    'RU5': frozenset([ 'RA5','RG5']),
     }
 
 use_standard_rna_3term_pair_list = {
-    'RA3': [ 'RC3','RU3'],
-    'RG3': [ 'RC3','RU3'],
-    'RC3': [ 'RA3','RG3'],
-    'RU3': [ 'RA3','RG3'],
+    'RA3': frozenset([ 'RC3','RU3']),
+    'RG3': frozenset([ 'RC3','RU3']),
+    'RC3': frozenset([ 'RA3','RG3']),
+    'RU3': frozenset([ 'RA3','RG3']),
     }
 
 use_standard_dna_pair_list = {
-    'DA': [ 'DC','DT'],
-    'DG': [ 'DC','DT'],
-    'DC': [ 'DA','DG'],
-    'DT': [ 'DA','DG'],
+    'DA': frozenset([ 'DC','DT']),
+    'DG': frozenset([ 'DC','DT']),
+    'DC': frozenset([ 'DA','DG']),
+    'DT': frozenset([ 'DA','DG']),
     }
 
 use_standard_dna_5term_pair_list = {
-    'DA5': [ 'DC5','DT5'],
-    'DG5': [ 'DC5','DT5'],
-    'DC5': [ 'DA5','DG5'],
-    'DT5': [ 'DA5','DG5'],
+    'DA5': frozenset([ 'DC5','DT5']),
+    'DG5': frozenset([ 'DC5','DT5']),
+    'DC5': frozenset([ 'DA5','DG5']),
+    'DT5': frozenset([ 'DA5','DG5']),
     }
 
 use_standard_dna_3term_pair_list = {
-    'DA3': [ 'DC3','DT3'],
-    'DG3': [ 'DC3','DT3'],
-    'DC3': [ 'DA3','DG3'],
-    'DT3': [ 'DA3','DG3'],
+    'DA3': frozenset([ 'DC3','DT3']),
+    'DG3': frozenset([ 'DC3','DT3']),
+    'DC3': frozenset([ 'DA3','DG3']),
+    'DT3': frozenset([ 'DA3','DG3']),
     }
 
-res_with_rings = [ 'HIS','HID','HIE','HIP','HISE','HISH','HIS1','HISD','HSE','HSD','HSP',
-		   'PHE','TYR','TRP','PRO' ]
+res_with_rings = frozenset([ 'HIS','HID','HIE','HIP','HISE','HISH','HIS1','HISD','HSE','HSD','HSP',
+		   'PHE','TYR','TRP','PRO' ])
 
-res_diff_Cb = [ 'THR', 'ALA', 'VAL', 'ILE' ]
+res_diff_Cb = frozenset([ 'THR', 'ALA', 'VAL', 'ILE' ])
 
-res_gly_pro = [ 'GLY', 'PRO' ]
+res_gly_pro = frozenset([ 'GLY', 'PRO' ])
+
+# protonation variants share the dihedral definitions of their parent residue
+dihedral_resname = dict.fromkeys(
+    [ 'HIS','HID','HIE','HIP','HISE','HISD','HISH','HIS1','HSD','HSE','HSP' ], 'HIS' )
+dihedral_resname.update( dict.fromkeys( [ 'LYN','LYSH','LSN' ], 'LYS' ) )
+dihedral_resname.update( dict.fromkeys( [ 'ASH','ASPH','ASPP' ], 'ASP' ) )
+dihedral_resname.update( dict.fromkeys( [ 'GLH','GLUH','GLUP' ], 'GLU' ) )
+dihedral_resname['CYSH'] = 'CYS'
 
 merge_by_name_list = {
     'PHE':['TYR'],
@@ -359,6 +168,65 @@ merge_by_name_list = {
     'HISE':['HIS1','HISD','HISH'],
     'HISH':['HIS1','HISD','HISE']
 }
+
+# merge_by_name_list is symmetric: store each pair once, sorted
+_merge_pairs = frozenset([tuple(sorted((k,v))) for k, vs in merge_by_name_list.items() for v in vs])
+
+def should_merge_by_name(a, b):
+    if a > b:
+        a, b = b, a
+    return (a, b) in _merge_pairs
+
+def aa_pair_category(resn1, resn2):
+    # which way two amino acids are paired, checked in order
+    #ring-res 2 ring-res
+    if resn2 in use_standard_pair_list.get( resn1, () ):
+        return 'standard'
+    #ring-res 2 non-ring-res: T,A,V,I
+    if (resn1 in res_with_rings and resn2 in res_diff_Cb ) or \
+       (resn2 in res_with_rings and resn1 in res_diff_Cb ):
+        return 'TAVI'
+    #ring-res 2 non-ring-res: G,P
+    if (resn1 in res_with_rings and resn2 in res_gly_pro ) or \
+       (resn2 in res_with_rings and resn1 in res_gly_pro ):
+        return 'GP'
+    #ringed residues by atom names 
+    if should_merge_by_name( resn1, resn2 ):
+        return 'merge'
+    #ring-res 2 non-ring-res
+    if resn1 in res_with_rings or resn2 in res_with_rings:
+        return 'rings'
+    if resn1 == 'GLY' or resn2 == 'GLY':
+        return 'gly'
+    return 'simple'
+
+aa_pair_messages = {
+    'standard':"ENTERED STANDARD",
+    'TAVI':"ENTERED T,A,V,I",
+    'GP':"ENTERED G,P",
+    'rings':"ENTERED RINGS",
+    'gly':"ENTERED SIMPLE",
+    'simple':"ENTERED SIMPLE"
+}
+
+# predefined (pair_list, pair_list_charmm) per (category, cbeta); anything
+# missing is paired by names ('merge') or by distance (make_pairs)
+_listB = (standard_pair_listB, standard_pair_list_charmmB)
+_listC = (standard_pair_listC, standard_pair_list_charmmC)
+_listD = (standard_pair_listD, standard_pair_list_charmmD)
+aa_pair_lists = {
+    ('standard',False):(standard_pair_list, standard_pair_list_charmm),
+    ('standard',True):_listC,
+    ('TAVI',False):_listC,
+    ('TAVI',True):_listC,
+    ('GP',False):_listD,
+    ('GP',True):_listD,
+    ('merge',True):_listC,
+    ('rings',False):_listB,
+    ('rings',True):_listC,
+    ('gly',True):_listD,
+    ('simple',True):_listC
+}
     
 
 mol_branch = {
@@ -398,46 +266,26 @@ noncanonical_aa = {
     'SP22S':'SP2S', # pSer2 to setine
 }
 
-dna_names = {
-    'DA5_DT5':'D5K',
-    'DA5_DC5':'D5L',
-    'DA5_DG5':'D5M',
-    'DT5_DA5':'D5N',
-    'DT5_DC5':'D5O',
-    'DT5_DG5':'D5P',
-    'DC5_DA5':'D5R',
-    'DC5_DT5':'D5S',
-    'DC5_DG5':'D5T',
-    'DG5_DA5':'D5X',
-    'DG5_DT5':'D5Y',
-    'DG5_DC5':'D5Z',
-    'DA3_DT3':'D3K',
-    'DA3_DC3':'D3L',
-    'DA3_DG3':'D3M',
-    'DT3_DA3':'D3N',
-    'DT3_DC3':'D3O',
-    'DT3_DG3':'D3P',
-    'DC3_DA3':'D3R',
-    'DC3_DT3':'D3S',
-    'DC3_DG3':'D3T',
-    'DG3_DA3':'D3X',
-    'DG3_DT3':'D3Y',
-    'DG3_DC3':'D3Z',
+# terminal DNA mutations: one letter code for each ordered base pair,
+# e.g. DA5 -> DT5 is D5K
+_dna_code = {
+    ('A','T'):'K', ('A','C'):'L', ('A','G'):'M',
+    ('T','A'):'N', ('T','C'):'O', ('T','G'):'P',
+    ('C','A'):'R', ('C','T'):'S', ('C','G'):'T',
+    ('G','A'):'X', ('G','T'):'Y', ('G','C'):'Z',
     }
+dna_names = { ('D'+a+t, 'D'+b+t): 'D'+t+c
+              for (a,b), c in _dna_code.items() for t in '53' }
+
+def _nt_mutation_naming(aa1,aa2,prefix):
+    rr_name = prefix+aa1[-1]+aa2[-1]
+    return(dna_names.get((aa1,aa2), rr_name))
 
 def dna_mutation_naming(aa1,aa2):
-    rr_name = 'D'+aa1[-1]+aa2[-1]
-    dict_key = aa1+'_'+aa2
-    if dict_key in dna_names.keys():
-	rr_name = dna_names[dict_key]
-    return(rr_name)
+    return _nt_mutation_naming(aa1,aa2,'D')
 
 def rna_mutation_naming(aa1,aa2):
-    rr_name = 'R'+aa1[-1]+aa2[-1]
-    dict_key = aa1+'_'+aa2
-    if dict_key in dna_names.keys():
-	rr_name = dna_names[dict_key]
-    return(rr_name)
+    return _nt_mutation_naming(aa1,aa2,'R')
 
 def max_rotation(dihedrals):
     m = 0
@@ -447,10 +295,25 @@ def max_rotation(dihedrals):
     return m+1
 
 def get_dihedrals(resname):
-    return library._aa_dihedrals[resname]
+    return _aa_dihedrals[resname]
+
+def atoms_rotating_with(mol, a3):
+    # atoms that move when rotating around a given a2-a3 bond, cached on
+    # the molecule and keyed by a3
+    cache = mol.__dict__.setdefault('_rot_cache', {})
+    if a3 in cache: return cache[a3]
+    tag = a3.long_name[3]
+    out = []
+    for atom in mol.atoms:
+        if atom.order > a3.order:
+            if tag==' ' or atom.long_name[3] in (tag,' '):
+#                print 'rotating', atom.name
+                out.append(atom)
+    cache[a3] = out
+    return out
 
 def set_dihedral(atoms,mol,phi):
-    print atoms[0].name,atoms[1].name,atoms[2].name
+    if bVerbose: print atoms[0].name,atoms[1].name,atoms[2].name
     a1 = atoms[0]
     a2 = atoms[1]
     a3 = atoms[2]
@@ -460,16 +323,7 @@ def set_dihedral(atoms,mol,phi):
     r = Rotation(a2.x,a3.x)
     rot = d-phi
 #    print a2.name, a3.name
-    for atom in mol.atoms:
-        if atom.order > a3.order:
-            if a3.long_name[3]==' ':
-#                print 'rotating', atom.name
-                atom.x = r.apply(atom.x,-rot)
-            else:
-                if atom.long_name[3]==a3.long_name[3] \
-                   or atom.long_name[3]==' ':
-#                    print 'rotating', atom.name
-                    atom.x = r.apply(atom.x,-rot)
+    r.apply_all(atoms_rotating_with(mol,a3),-rot)
 #    print a1.dihedral(a2,a3,a4)
 
 def is_number(s):
@@ -504,10 +358,10 @@ def do_fit(m1,dihed1,m2,dihed2):
 #                dih1[d] = foo[-1] + foo[0] + foo[1]
 
         atoms1 = m1.fetchm(dih1)
-	print "fetching"
+	if bVerbose: print "fetching"
         atoms2 = m2.fetchm(dih2)
-	print dih2
-	print atoms2
+	if bVerbose: print dih2
+	if bVerbose: print atoms2
         a1,a2,a3,a4 = atoms1
         if (a2.name, a3.name) not in bonds:
             phi = a1.dihedral(a2,a3,a4)
@@ -561,7 +415,7 @@ def assign_rtp_entries( mol, rtp):
         atom_type = atom_entry[1]
         atom_q    = atom_entry[2]
         atom_cgnr = atom_entry[3]
-        print "foo ",atom_name
+        if bVerbose: print "foo ",atom_name
         atom = mol.fetch( atom_name )[0]
         atom.atomtype = atom_type
         atom.q = atom_q
@@ -583,14 +437,11 @@ def assign_rtp_entries( mol, rtp):
     return neigh
         
 
+_branch_of = {' ':0, '1':1}
+
 def assign_branch(mol):
     for atom in mol.atoms:
-        if atom.long_name[-1] == ' ':
-            atom.branch = 0
-        elif atom.long_name[-1] == '1':
-            atom.branch = 1
-        else:
-            atom.branch = 2
+        atom.branch = _branch_of.get(atom.long_name[-1], 2)
         
 def get_atoms_by_order(mol,order):
     res = []
@@ -599,11 +450,30 @@ def get_atoms_by_order(mol,order):
             res.append(atom)
     return res
 
-def get_atoms_by_order_and_branch( mol, order, branch, merged_atoms ):
-    res = []
+def _order_index( mol ):
+    # atoms of each order, in molecule order
+    by_order = {}
     for atom in mol.atoms:
+        by_order.setdefault( atom.order, [] ).append( atom )
+    return by_order
+
+def get_atoms_by_order_and_branch( mol, order, branch, merged_atoms, by_order=None ):
+    res = []
+    # looked up once per call, and only when an atom needs it, so that a
+    # residue missing from mol_branch still raises a KeyError naming it
+    max_branch = None
+    if by_order is None:
+        atoms = mol.atoms
+    else:
+        atoms = by_order.get( order, [] )
+    for atom in atoms:
         if atom.order == order and atom not in merged_atoms:
-            if atom.branch in [0,branch] or atom.branch < mol_branch[mol.real_resname] + 1:
+            if atom.branch in (0,branch):
+                res.append(atom)
+                continue
+            if max_branch is None:
+                max_branch = mol_branch[mol.real_resname]
+            if atom.branch < max_branch + 1:
                 res.append(atom)
     return res
     
@@ -614,9 +484,18 @@ def last_atom_is_morphed( atom, merged_list ):
             return True
     return False
 
+# sybyl types form a small closed set, so every pair is only compared once
+_mol2_types_match = {}
+
 def cmp_mol2_types( type1, type2 ):
     if type1 == type2 : return True
     if type1 == 'H' or type2 == 'H': return True
+    key = (type1, type2)
+    if key not in _mol2_types_match:
+        _mol2_types_match[key] = _cmp_mol2_types( type1, type2 )
+    return _mol2_types_match[key]
+
+def _cmp_mol2_types( type1, type2 ):
     tp1_ext = type1.split('.')[1]
     tp2_ext = type2.split('.')[1]
     if tp1_ext in ['2','3'] and \
@@ -638,25 +517,33 @@ def cmp_mol2_types( type1, type2 ):
         
         
 def find_closest_atom( atom1, atom_list, merged_atoms, bH2heavy=True ):
-    min_d = 0.55
-    idx = 99
-    for i, atom in enumerate(atom_list):
-        if atom not in merged_atoms:
-	    if bH2heavy==False:
-                ### check for H2heavy morphe ###
-                if(atom1.atomtype.startswith('H') and (not atom.atomtype.startswith('H')) ):
-                    continue
-                if(atom.atomtype.startswith('H') and (not atom1.atomtype.startswith('H')) ):
-                    continue
-
-            d = atom1 - atom
-	    print "%s %s %f" %(atom1.name,atom.name,d)
-            if d < min_d:
-                min_d = d
-                idx = i
-    if idx != 99:
-        return atom_list[idx], min_d
-    else: return None, None
+    # candidates are the unmerged atoms, without H2heavy morphes only
+    # those of the same kind (hydrogen/heavy) as atom1
+    bH1 = atom1.atomtype.startswith('H')
+    idx = [i for i, atom in enumerate(atom_list) if atom not in merged_atoms and \
+           (bH2heavy or atom.atomtype.startswith('H') == bH1)]
+    if not idx:
+        return None, None
+    xyz = np.array([atom_list[i].x for i in idx], dtype=float) - atom1.x
+    # compare squared distances, only the closest one needs the sqrt
+    d2 = np.einsum('ij,ij->i', xyz, xyz)
+    i = int(d2.argmin())
+    d = np.sqrt(d2[i])
+    if d < 0.55:
+        return atom_list[idx[i]], float(d)
+    return None, None
+
+def _name_index( mol ):
+    # first atom of each name, i.e. what mol.fetch(name)[0] returns
+    idx = {}
+    for atom in mol.atoms:
+        idx.setdefault( atom.name, atom )
+    return idx
+
+def _unmatched_by_name( mol, merged_atoms ):
+    # same selection as mol.fetch_atoms( merged names, inv = True )
+    names = set( [atom.name for atom in merged_atoms] )
+    return [atom for atom in mol.atoms if atom.name not in names]
 
 def make_predefined_pairs( mol1, mol2, pair_list ):
     # make main chain + cb pairs
@@ -664,15 +551,17 @@ def make_predefined_pairs( mol1, mol2, pair_list ):
     atom_pairs = []
     merged_atoms1 = []
     merged_atoms2 = []
+    idx1 = _name_index( mol1 )
+    idx2 = _name_index( mol2 )
     for name1, name2 in pair_list:
 	try:
-	    at1 = mol1.fetch( name1 )[0]
-	except IndexError:
-	    at1 = mol1.fetch( reformat_atom_name(name1) )[0]
+	    at1 = idx1[ name1 ]
+	except KeyError:
+	    at1 = idx1[ reformat_atom_name(name1) ]
         try:
-            at2 = mol2.fetch( name2 )[0]
-        except IndexError:
-            at2 = mol2.fetch( reformat_atom_name(name2) )[0]
+            at2 = idx2[ name2 ]
+        except KeyError:
+            at2 = idx2[ reformat_atom_name(name2) ]
 	at1.name = reformat_atom_name(name1)
         at2.name = reformat_atom_name(name2)
 #	print name1,name2
@@ -687,7 +576,7 @@ def make_predefined_pairs( mol1, mol2, pair_list ):
         atom_pairs.append( [at1, at2] )
 ##         if atom.atomtypeB.startswith('DUM'):
 ##             atom.nameB = atom.name+'.gone'
-    dummies = mol2.fetch_atoms( map( lambda a: a.name, merged_atoms1), inv = True )
+    dummies = _unmatched_by_name( mol2, merged_atoms1 )
     return atom_pairs, dummies
 
 def merge_by_names( mol1, mol2 ):
@@ -695,9 +584,10 @@ def merge_by_names( mol1, mol2 ):
     atom_pairs = []
     merged_atoms1 = []
     merged_atoms2 = []
+    idx2 = _name_index( mol2 )
     for at1 in mol1.atoms:
-        try:
-            at2 = mol2.fetch( at1.name )[0]
+        at2 = idx2.get( at1.name )
+        if at2 is not None:
             at1.atomtypeB = at2.atomtype
             at1.qB = at2.q
             at1.mB = at2.m
@@ -705,11 +595,9 @@ def merge_by_names( mol1, mol2 ):
             merged_atoms1.append( at1 )
             merged_atoms2.append( at2 )
             atom_pairs.append( [at1, at2] )
-        except:
-            pass
 ##         if atom.atomtypeB.startswith('DUM'):
 ##             atom.nameB = atom.name+'.gone'
-    dummies = mol2.fetch_atoms( map( lambda a: a.name, merged_atoms1), inv = True )
+    dummies = _unmatched_by_name( mol2, merged_atoms1 )
     return atom_pairs, dummies
 
     
@@ -718,8 +606,9 @@ def make_pairs( mol1, mol2,bCharmm, bH2heavy=True, bDNA=False, bRNA=False ):
     # make main chain + cb pairs
     print 'Making atom pairs.........'
     mol1.batoms = []
-    merged_atoms1 = []
-    merged_atoms2 = []
+    # only used for membership tests
+    merged_atoms1 = set()
+    merged_atoms2 = set()
     atom_pairs = []
     if bDNA or bRNA:
 	mc_list = []
@@ -739,14 +628,10 @@ def make_pairs( mol1, mol2,bCharmm, bH2heavy=True, bDNA=False, bRNA=False ):
     else:
         atoms2 = mol2.fetchm( mc_list )
 
+    # the B state of every pair is set once, after the side chain search
     for at1, at2 in zip( atoms1, atoms2 ):
-        at1.atomtypeB = at2.atomtype
-        at1.qB = at2.q
-        at1.mB = at2.m
-        at1.nameB = at2.name
-        mol1.batoms.append( at2 )
-        merged_atoms1.append( at1 )
-        merged_atoms2.append( at2 )
+        merged_atoms1.add( at1 )
+        merged_atoms2.add( at2 )
         atom_pairs.append( [at1, at2] )
     # now go for the rest of the side chain
 
@@ -754,15 +639,29 @@ def make_pairs( mol1, mol2,bCharmm, bH2heavy=True, bDNA=False, bRNA=False ):
 	# identify atom morphes by distances
 	atoms1 = mol1.atoms
 	atoms2 = mol2.atoms
-        for at1 in atoms1:
-            print '-- Checking atom...', at1.name
-   	    aa, d = find_closest_atom( at1, atoms2, merged_atoms2, bH2heavy )
-	    if aa:
-                merged_atoms2.append( aa )
-                merged_atoms1.append( at1 )
+        # nothing moves while pairing, so all distances are computed up front
+        X1 = np.array([a.x for a in atoms1], dtype=float)
+        X2 = np.array([a.x for a in atoms2], dtype=float)
+        D = np.sqrt( ((X1[:,np.newaxis,:] - X2[np.newaxis,:,:])**2).sum(axis=2) )
+        isH2 = np.array([a.atomtype.startswith('H') for a in atoms2], dtype=bool)
+        taken = np.array([a in merged_atoms2 for a in atoms2], dtype=bool)
+        for i, at1 in enumerate(atoms1):
+            if bVerbose: print '-- Checking atom...', at1.name
+            row = np.where( taken, np.inf, D[i] )
+            if not bH2heavy:
+                row[isH2 != at1.atomtype.startswith('H')] = np.inf
+            j = int(row.argmin())
+            if row[j] < 0.55:
+                aa = atoms2[j]
+                taken[j] = True
+                merged_atoms2.add( aa )
+                merged_atoms1.add( at1 )
                 atom_pairs.append( [ at1, aa] )
-	        print "here ",at1.name, aa.name
+                if bVerbose: print "here ",at1.name, aa.name
     else:
+        # the orders are fixed, only scan the atoms of the order asked for
+        by_order1 = _order_index( mol1 )
+        by_order2 = _order_index( mol2 )
         for k in [1,2]:
             print '-- Searching branch', k
             done_branch = False
@@ -770,8 +669,8 @@ def make_pairs( mol1, mol2,bCharmm, bH2heavy=True, bDNA=False, bRNA=False ):
                 if done_branch: break
                 print '-- Searching order', i
 
-                atoms1 = get_atoms_by_order_and_branch( mol1, i, k, merged_atoms1 )
-                atoms2 = get_atoms_by_order_and_branch( mol2, i, k, merged_atoms2 )
+                atoms1 = get_atoms_by_order_and_branch( mol1, i, k, merged_atoms1, by_order1 )
+                atoms2 = get_atoms_by_order_and_branch( mol2, i, k, merged_atoms2, by_order2 )
                 for at1 in atoms1:
                     if last_atom_is_morphed( at1, merged_atoms1 ):
                         print '-- Checking atom...', at1.name
@@ -781,8 +680,8 @@ def make_pairs( mol1, mol2,bCharmm, bH2heavy=True, bDNA=False, bRNA=False ):
                             candidates.append( at2 )
                         aa, d = find_closest_atom( at1, candidates, merged_atoms2, bH2heavy )
                         if aa:
-                            merged_atoms2.append( aa )
-                            merged_atoms1.append( at1 )
+                            merged_atoms2.add( aa )
+                            merged_atoms1.add( at1 )
                             atom_pairs.append( [ at1, aa] )
                             print '--> Define atom pair: ', tag(at1), '- >', tag(aa),  '(d = %4.2f A)' % d
                         else:
@@ -792,7 +691,7 @@ def make_pairs( mol1, mol2,bCharmm, bH2heavy=True, bDNA=False, bRNA=False ):
 ##                         break # done with this branch
 
     for at1, at2 in atom_pairs:
-	print at1,at2
+	if bVerbose: print at1,at2
         at1.atomtypeB = at2.atomtype
         at1.qB = at2.q
         at1.mB = at2.m
@@ -810,9 +709,12 @@ def make_pairs( mol1, mol2,bCharmm, bH2heavy=True, bDNA=False, bRNA=False ):
 
 
 def check_double_atom_names( r ):
+    # count the names once instead of fetching every name again
+    count = {}
+    for atom in r.atoms:
+        count[atom.name] = count.get( atom.name, 0 ) + 1
     for atom in r.atoms:
-        alist = r.fetch_atoms( atom.name )
-        if len(alist) != 1:
+        if count[atom.name] != 1:
             alist = r.fetch_atoms( atom.name[:-1], wildcard = True )
             print 'Renaming atoms (%s)' % alist[0].name[:-1]
             start = 1
@@ -825,7 +727,7 @@ def check_double_atom_names( r ):
 def merge_molecules( r1, dummies ):
     
     for atom in dummies:
-        new_atom = atom.copy()
+        new_atom = atom.clone()
         new_atom.atomtypeB = new_atom.atomtype
         new_atom.qB = new_atom.q
         new_atom.mB = new_atom.m
@@ -864,8 +766,7 @@ def make_transition_dics( atom_pairs, r1 ):
     return abdic, badic
 
 def find_atom_by_nameB( r, name ):
-    n = 0
-    for atom in r1.atoms:
+    for atom in r.atoms:
         if atom.nameB == name:
             return atom
     return None
@@ -873,54 +774,77 @@ def find_atom_by_nameB( r, name ):
 def update_bond_lists(r1, badic):
 
     print 'Updating bond lists...........'
+    # names do not change in here, index them once (first match wins,
+    # like fetch() and find_atom_by_nameB)
+    by_name = _name_index( r1 )
+    by_nameB = {}
+    for atom in r1.atoms:
+        by_nameB.setdefault( atom.nameB, atom )
+    # bond partners as sets, filled on first use and kept in sync with
+    # the bond lists
+    bonded = {}
     for atom in r1.atoms:
         if atom.name[0] == 'D':
-            print 'atom', atom.name
-            print '  |  '
+            if bVerbose: print 'atom', atom.name
+            if bVerbose: print '  |  '
             new_list = []
-            while atom.bonds:
-                at = atom.bonds.pop(0)
-                print atom.name, '->', at.name
+            for at in atom.bonds:
+                if bVerbose: print atom.name, '->', at.name
                 if badic.has_key(at.name):
-                    aa = r1.fetch( badic[at.name] )[0]
+                    aa = by_name[ badic[at.name] ]
                     new_list.append( aa )
                 else:
-                    aa = find_atom_by_nameB( r1, at.name )
+                    aa = by_nameB.get( at.name )
                     if aa is not None:
                         new_list.append(aa)
                     else:
                         print 'Atom not found', at.name, at.nameB
                         sys.exit(1)
             atom.bonds = new_list
+            bonded[atom] = set( new_list )
             for at in atom.bonds:
-                if atom not in at.bonds:
+                if at not in bonded:
+                    bonded[at] = set( at.bonds )
+                if atom not in bonded[at]:
                     at.bonds.append( atom )
-                print  '----bond--->', at.name
-            print
+                    bonded[at].add( atom )
+                if bVerbose: print  '----bond--->', at.name
+            if bVerbose: print
+
+def _entry_names( lst ):
+    return tuple([a.name for a in lst])
 
 def improp_entries_match( lst1, lst2 ):
-    res = True
-    for a1, a2 in zip(lst1, lst2):
-#	print "foo ",a1.name,a2.name
-        if a1.name != a2.name: res=False
-    if( res==True ):
-	return res
-    res = True
-    for a1, a2 in zip(lst1, list(reversed(lst2))):
-#	print "foo ",a1.name,a2.name
-        if a1.name != a2.name: res=False
-    return res
+    n1 = _entry_names(lst1)
+    n2 = _entry_names(lst2)
+    return n1 == n2 or n1 == n2[::-1]
+
+# entries are [atom1,atom2,atom3,atom4,params...]; the done_* sets hold
+# them as tuples, which compare like the lists did
+def _has_gone( ii ):
+    for atom in ii[:4]:
+        if 'gone' in atom.nameB: return True
+    return False
+
+def _has_dummy( ii ):
+    for atom in ii[:4]:
+        if atom.name.startswith('D'): return True
+    return False
 
 def generate_dihedral_entries( im1, im2, r, pairs ):
     print 'Updating dihedrals...........'
     new_ii = []
-    done_i1 = []
-    done_i2 = []
+    done_i1 = set()
+    done_i2 = set()
     # ILDN dihedrals
+    # names of the im2 entries, forward and reversed, for improp_entries_match
+    im2_names = [ _entry_names(i2[:4]) for i2 in im2 ]
+    im2_names = [ (n2, n2[::-1]) for n2 in im2_names ]
     for i1 in im1:
 	#print '%s %s %s %s %s' % (i1[0].name,i1[1].name,i1[2].name,i1[3].name,i1[4])
-        for i2 in im2:
-            if improp_entries_match(i1[:4], i2[:4]) and (i2 not in done_i2):
+        n1 = _entry_names(i1[:4])
+        for i2, (n2, rn2) in zip( im2, im2_names ):
+            if (n1 == n2 or n1 == rn2) and (tuple(i2) not in done_i2):
                 im_new = i1[:4]
                 if i1[4] == '': 
 		    im_new.append( 'default-A' )
@@ -930,27 +854,27 @@ def generate_dihedral_entries( im1, im2, r, pairs ):
 		    im_new.append( 'default-B' )
                 else: 
 		    im_new.append( i2[4] )
-                done_i1.append( i1 )
-                done_i2.append( i2 )
+                done_i1.add( tuple(i1) )
+                done_i2.add( tuple(i2) )
                 new_ii.append( im_new )
 		break
     for i1 in im1:
-        if i1 not in done_i1:
+        if tuple(i1) not in done_i1:
             im_new =  i1[:4]
             if i1[4] == '': 
                 im_new.append( 'default-A' )
-                if( ('gone' in i1[0].nameB) or ('gone' in i1[1].nameB) or ('gone' in i1[2].nameB) or ('gone' in i1[3].nameB) ):
+                if( _has_gone(i1) ):
                     im_new.append( 'default-A' )
                 else:
                     im_new.append( 'un' )
             else:
-		if ( ('gone' in i1[0].nameB) or ('gone' in i1[1].nameB) or ('gone' in i1[2].nameB) or ('gone' in i1[3].nameB) ):
+		if ( _has_gone(i1) ):
   	            im_new.append( i1[4] )
                     im_new.append( i1[4] )
 		else:
                     im_new.append( i1[4] )
                     if( 'torsion' in i1[4] ):	#ildn
-			tors = copy.deepcopy(i1[4])
+			tors = i1[4]
 			tors = tors.replace('torsion','tors')
                         foo = 'un' + tors
                         im_new.append( foo )
@@ -961,21 +885,21 @@ def generate_dihedral_entries( im1, im2, r, pairs ):
                         im_new.append( 'un' )
             new_ii.append( im_new )
     for i2 in im2:
-        if i2 not in done_i2:
+        if tuple(i2) not in done_i2:
             im_new =  i2[:4] 
             if i2[4] == '': 
-                if( (i2[0].name.startswith('D')) or (i2[1].name.startswith('D')) or (i2[2].name.startswith('D')) or (i2[3].name.startswith('D')) ):
+                if( _has_dummy(i2) ):
                     im_new.append( 'default-B' )
                 else:
                     im_new.append( 'un' )
 		im_new.append( 'default-B' )
             else: 
-                if ( (i2[0].name.startswith('D')) or (i2[1].name.startswith('D')) or (i2[2].name.startswith('D')) or (i2[3].name.startswith('D')) ):
+                if ( _has_dummy(i2) ):
                     im_new.append( i2[4] )
                     im_new.append( i2[4] )
                 else:
                     if( 'torsion' in i2[4] ):	#ildn
-                        tors = copy.deepcopy(i2[4])
+                        tors = i2[4]
                         tors = tors.replace('torsion','tors')
 			foo = 'un' + tors
 			im_new.append( foo )
@@ -993,13 +917,17 @@ def generate_improp_entries( im1, im2, r ):
     print 'Updating impropers...........'
     
     new_ii = []
-    done_i1 = []
-    done_i2 = []
+    done_i1 = set()
+    done_i2 = set()
     # common impropers
+    # names of the im2 entries, forward and reversed, for improp_entries_match
+    im2_names = [ _entry_names(i2[:4]) for i2 in im2 ]
+    im2_names = [ (n2, n2[::-1]) for n2 in im2_names ]
     for i1 in im1:
-        for i2 in im2:
-            if improp_entries_match(i1[:4], i2[:4]):
-		print 'alus %s' % i1[4]
+        n1 = _entry_names(i1[:4])
+        for i2, (n2, rn2) in zip( im2, im2_names ):
+            if n1 == n2 or n1 == rn2:
+		if bVerbose: print 'alus %s' % i1[4]
                 im_new = i1[:4]
                 if i1[4] == '': 
 		    im_new.append( 'default-A' )
@@ -1013,15 +941,15 @@ def generate_improp_entries( im1, im2, r ):
                     im_new.append( 'default-star' )
                 else: 
 		    im_new.append( i2[4] )
-                done_i1.append( i1 )
-                done_i2.append( i2 )
+                done_i1.add( tuple(i1) )
+                done_i2.add( tuple(i2) )
                 new_ii.append( im_new )
     for i1 in im1:
-        if i1 not in done_i1:
+        if tuple(i1) not in done_i1:
             im_new =  i1[:4] 
             if i1[4] == '': 
 	        im_new.append( 'default-A' )
-		if( ('gone' in i1[0].nameB) or ('gone' in i1[1].nameB) or ('gone' in i1[2].nameB) or ('gone' in i1[3].nameB) ):
+		if( _has_gone(i1) ):
 	            im_new.append( 'default-A' )
 		else:
 		    im_new.append( 'un' )
@@ -1030,17 +958,17 @@ def generate_improp_entries( im1, im2, r ):
                 im_new.append( 'un' )
             else: 
 		im_new.append( i1[4] )
-                if( ('gone' in i1[0].nameB) or ('gone' in i1[1].nameB) or ('gone' in i1[2].nameB) or ('gone' in i1[3].nameB) ):
+                if( _has_gone(i1) ):
                     im_new.append( i1[4] )
                 else:
                     im_new.append( 'un' )
             new_ii.append( im_new )
     for i2 in im2:
-        if i2 not in done_i2:
+        if tuple(i2) not in done_i2:
             im_new =  i2[:4] #[ find_atom_by_nameB(r, n) for n in i2[:4] ] 
 #            im_new.append( 'default-B' )
             if i2[4] == '': 
-                if( (i2[0].name.startswith('D')) or (i2[1].name.startswith('D')) or (i2[2].name.startswith('D')) or (i2[3].name.startswith('D')) ):
+                if( _has_dummy(i2) ):
                     im_new.append( 'default-B' )
                 else:
                     im_new.append( 'un' )
@@ -1049,7 +977,7 @@ def generate_improp_entries( im1, im2, r ):
                 im_new.append( 'un' )
                 im_new.append( 'default-star' )
             else:
-                if( (i2[0].name.startswith('D')) or (i2[1].name.startswith('D')) or (i2[2].name.startswith('D')) or (i2[3].name.startswith('D')) ):
+                if( _has_dummy(i2) ):
                     im_new.append( i2[4] )
                 else:
                     im_new.append( 'un' )
@@ -1061,77 +989,82 @@ def generate_improp_entries( im1, im2, r ):
     return new_ii
 
 def write_rtp( fp, r, ii_list, dihi_list,neigh_bonds,cmap):
-    print >>fp,'\n[ %s ] ; %s -> %s\n' % (r.resname, r.resnA, r.resnB)
-    print >>fp,' [ atoms ]'
-    cgnr = 1
-    for atom in r.atoms:
-        print >>fp, "%6s   %-15s  %8.5f  %d" % (atom.name, atom.atomtype, atom.q, cgnr)
-        cgnr+=1
-    print >>fp,'\n [ bonds ]'
+    # collect the lines and write the entry in one go
+    out = []
+    out.append('\n[ %s ] ; %s -> %s\n' % (r.resname, r.resnA, r.resnB))
+    out.append(' [ atoms ]')
+    for cgnr, atom in enumerate(r.atoms, 1):
+        out.append("%6s   %-15s  %8.5f  %d" % (atom.name, atom.atomtype, atom.q, cgnr))
+    out.append('\n [ bonds ]')
     for atom in r.atoms:
         for at  in atom.bonds:
             if atom.id < at.id:
-                print >>fp, "%6s  %6s ; (%6s  %6s)" % ( atom.name, at.name, atom.nameB, at.nameB )
+                out.append("%6s  %6s ; (%6s  %6s)" % ( atom.name, at.name, atom.nameB, at.nameB ))
     #MS here there will have to be a check for FF, since for charmm we need to add C N
     #MSsave those bonds with previous and next residue as a seperate entry
     for i in neigh_bonds :
-        print >>fp, "%6s  %6s  " % (i[0],i[1])
+        out.append("%6s  %6s  " % (i[0],i[1]))
 
-    print >>fp,'\n [ impropers ]'
+    out.append('\n [ impropers ]')
     for ii in ii_list:
         if not ii[4].startswith('default'):
-            print >>fp, "%6s  %6s  %6s  %6s  %-25s" % ( ii[0].name, ii[1].name, ii[2].name, ii[3].name, ii[4])
+            out.append("%6s  %6s  %6s  %6s  %-25s" % ( ii[0].name, ii[1].name, ii[2].name, ii[3].name, ii[4]))
         else:
-            print >>fp, "%6s  %6s  %6s  %6s " % ( ii[0].name, ii[1].name, ii[2].name, ii[3].name)
+            out.append("%6s  %6s  %6s  %6s " % ( ii[0].name, ii[1].name, ii[2].name, ii[3].name))
 
-    print >>fp,'\n [ dihedrals ]'
+    out.append('\n [ dihedrals ]')
     for ii in dihi_list:
         if not ii[4].startswith('default'):
-            print >>fp, "%6s  %6s  %6s  %6s  %-25s" % ( ii[0].name, ii[1].name, ii[2].name, ii[3].name, ii[4])
+            out.append("%6s  %6s  %6s  %6s  %-25s" % ( ii[0].name, ii[1].name, ii[2].name, ii[3].name, ii[4]))
         else:
-            print >>fp, "%6s  %6s  %6s  %6s " % ( ii[0].name, ii[1].name, ii[2].name, ii[3].name)
+            out.append("%6s  %6s  %6s  %6s " % ( ii[0].name, ii[1].name, ii[2].name, ii[3].name))
     if cmap :
-        print >>fp,'\n [ cmap ]'
+        out.append('\n [ cmap ]')
     for i in cmap:
-        print >>fp, "%s  " % (i)
+        out.append("%s  " % (i))
+    fp.write('\n'.join(out)+'\n')
+
+# [ atoms ] comment of write_mtp, keyed by (types differ, charges differ)
+_mtp_ext = {}
+for _t in (False, True):
+    for _q in (False, True):
+        _mtp_ext[_t, _q] = ' ; ' + (' types != ' if _t else ' types == ') + \
+                           ('| charge != ' if _q else '| charge == ')
 
 def write_mtp( fp, r, ii_list, rotations, dihi_list ):
-    print >>fp,'\n[ %s ] ; %s -> %s\n' % (r.resname, r.resnA, r.resnB)
-    print >>fp,'\n [ morphes ]'
+    out = []
+    out.append('\n[ %s ] ; %s -> %s\n' % (r.resname, r.resnA, r.resnB))
+    out.append('\n [ morphes ]')
     for atom in r.atoms:
-        print >>fp, "%6s %10s -> %6s %10s" % ( atom.name, atom.atomtype, atom.nameB, atom.atomtypeB )
-    print >>fp,'\n [ atoms ]'
+        out.append("%6s %10s -> %6s %10s" % ( atom.name, atom.atomtype, atom.nameB, atom.atomtypeB ))
+    out.append('\n [ atoms ]')
     cgnr = 1
     for atom in r.atoms:
-        ext = ' ; '
-        if atom.atomtype != atom.atomtypeB: ext+= ' types != '
-        else: ext+= ' types == '
-        if atom.q != atom.qB: ext+= '| charge != '
-        else: ext+= '| charge == '
-
-        print >>fp ,"%8s %10s %10.6f %6d %10.6f %10s %10.6f %10.6f  %-10s" % \
-              ( atom.name, atom.atomtype, atom.q, cgnr, atom.m, atom.atomtypeB, atom.qB, atom.mB, ext )
-    print >>fp,'\n [ coords ]'
+        ext = _mtp_ext[ atom.atomtype != atom.atomtypeB, atom.q != atom.qB ]
+        out.append("%8s %10s %10.6f %6d %10.6f %10s %10.6f %10.6f  %-10s" % \
+              ( atom.name, atom.atomtype, atom.q, cgnr, atom.m, atom.atomtypeB, atom.qB, atom.mB, ext ))
+    out.append('\n [ coords ]')
     for atom in r.atoms:
-        print >>fp,"%8.3f %8.3f %8.3f" % (atom.x[0], atom.x[1], atom.x[2])
+        out.append("%8.3f %8.3f %8.3f" % (atom.x[0], atom.x[1], atom.x[2]))
 
-    print >>fp,'\n [ impropers ]'
+    out.append('\n [ impropers ]')
     for ii in ii_list:
-        print >>fp," %6s %6s %6s %6s     %-25s %-25s  " % \
-              ( ii[0].name, ii[1].name, ii[2].name, ii[3].name, ii[4], ii[5] )
+        out.append(" %6s %6s %6s %6s     %-25s %-25s  " % \
+              ( ii[0].name, ii[1].name, ii[2].name, ii[3].name, ii[4], ii[5] ))
     print
 
-    print >>fp,'\n [ dihedrals ]'
+    out.append('\n [ dihedrals ]')
     for ii in dihi_list:
-        print >>fp," %6s %6s %6s %6s     %-25s %-25s  " % \
-              ( ii[0].name, ii[1].name, ii[2].name, ii[3].name, ii[4], ii[5] )
+        out.append(" %6s %6s %6s %6s     %-25s %-25s  " % \
+              ( ii[0].name, ii[1].name, ii[2].name, ii[3].name, ii[4], ii[5] ))
     print
 
     if rotations:
-        print >>fp, '\n [ rotations ]'
+        out.append('\n [ rotations ]')
         for rot in rotations:
-            print >>fp, '  %s-%s %s' % (rot[0].name, rot[1].name, ' '.join( map(lambda a: a.name, rot[2:]) ) )
-        print >>fp
+            out.append('  %s-%s %s' % (rot[0].name, rot[1].name, ' '.join( map(lambda a: a.name, rot[2:]) ) ))
+        out.append('')
+    fp.write('\n'.join(out)+'\n')
 
 def primitive_check( atom, rot_atom ):
     if atom in rot_atom.bonds: return True
@@ -1140,17 +1073,17 @@ def primitive_check( atom, rot_atom ):
 def find_higher_atoms( rot_atom, r, order, branch ):
     res = []
     for atom in r.atoms:
-        print "1level: %s %s %s" % (atom.name,atom.order,atom.branch)
+        if bVerbose: print "1level: %s %s %s" % (atom.name,atom.order,atom.branch)
 	if( ('gone' in rot_atom.nameB) and atom.name.startswith('D') ):
 	    continue
 #        if atom.order >= order and \
 #           (atom.branch == branch or branch == 0):
         if atom.order >= order:
-            print "2level: %s %s %s" % (atom.name,atom.order,atom.branch)
+            if bVerbose: print "2level: %s %s %s" % (atom.name,atom.order,atom.branch)
             if atom.order ==  rot_atom.order+1:
-	        print "3level: %s %s %s" % (atom.name,atom.order,atom.branch)
+	        if bVerbose: print "3level: %s %s %s" % (atom.name,atom.order,atom.branch)
                 if primitive_check( atom, rot_atom ):
-        	    print "4level: %s %s %s" % (atom.name,atom.order,atom.branch)
+        	    if bVerbose: print "4level: %s %s %s" % (atom.name,atom.order,atom.branch)
                     res.append( atom )
             else:
                 res.append( atom )            
@@ -1159,21 +1092,20 @@ def find_higher_atoms( rot_atom, r, order, branch ):
 
 def make_rotations( r, resn1_dih, resn2_dih ):
     dihed1 = get_dihedrals(resn1_dih)
-    dihed2 = get_dihedrals(resn2_dih)
     rots = []
-    done = []
+    done = set()
     for d in dihed1:
         if d[-2] != 0 and d[-1] > 0:
             key =  d[1]+'-'+d[2]
             if key not in done:
                 rots.append(d)
-                done.append(key)
+                done.add(key)
     for d in dihed1:
         if d[-2] != 0 and d[-1] != 0 and d[2] not in ['N','C','CA']:
             key =  d[1]+'-'+d[2]
             if key not in done:
                 rots.append(d)
-                done.append(key)
+                done.add(key)
 
     rotations = []
 #    for chi in range(1, r.nchi() + 1):
@@ -1183,13 +1115,14 @@ def make_rotations( r, resn1_dih, resn2_dih ):
 #        rot_atoms = [ dih_atoms[1], dih_atoms[2] ]
 #        atom1 = rot_atoms[0]
 #        atom2 = rot_atoms[1]
-	atom1 = r.fetchm( chi )[1]
-	atom2 = r.fetchm( chi )[2]
+	picked = r.fetchm( chi )
+	atom1 = picked[1]
+	atom2 = picked[2]
         rot_list.append( atom1 )
         rot_list.append( atom2 )
         oo = atom2.order
         bb = atom2.branch
-        print "AAAAAAAAA %s %s %s" %(atom2,oo+1,bb)
+        if bVerbose: print "AAAAAAAAA %s %s %s" %(atom2,oo+1,bb)
         atoms_to_rotate = []
         atoms_to_rotate =  find_higher_atoms(atom2,  r, oo+1, bb ) 
         for atom in atoms_to_rotate:
@@ -1199,58 +1132,77 @@ def make_rotations( r, resn1_dih, resn2_dih ):
 #    sys.exit(0)
     return rotations
 
-def parse_ffnonbonded_charmm(ffnonbonded,f):
-    ifile=open(ffnonbonded,'r')
-    lines=ifile.readlines()
-    #now clean the heavy atom entries from file and write it to temp file
+def parse_ffnonbonded_charmm(ffnonbonded):
+    #now clean the heavy atom entries from file, NBParser takes the list as is
+    kept = []
     bAdd=True
-    for line in lines:
-        if line.strip()=='#ifdef HEAVY_H' :
+    ifile=open(ffnonbonded,'r')
+    for line in ifile:
+        tag = line.strip()
+        if tag=='#ifdef HEAVY_H' :
 	    bAdd=False
 	if bAdd and line[0]!='#':
-	    f.write(line)
-	if line.strip()=='#else' :
-	    bAdd=True
-	if line.strip()=='#endif' :
+	    kept.append(line)
+	if tag=='#else' or tag=='#endif' :
 	    bAdd=True
+    ifile.close()
+    return kept
+
+# parsed atomtypes and modification time of the file, keyed by the arguments
+# they were read with; the file is read again only when it changed since
+_nb_atomtypes = {}
+_atp_masses = {}
 
 def assign_mass(r1, r2,ffnonbonded,bCharmm,ff):
-    #MS open ffnonbonded, remove HEAVY_H, pass it to NBParser 
-    if bCharmm : 
-        f=tempfile.NamedTemporaryFile(delete=False)
-	parse_ffnonbonded_charmm(ffnonbonded,f)
-	print f.name
-        NBParams = NBParser(f.name,'new',ff)
-	f.close()
-    else : 
-        NBParams = NBParser(ffnonbonded,'new',ff)
-    for atom in r1.atoms+r2.atoms:
+    key = (ffnonbonded,bCharmm,ff)
+    mtime = os.path.getmtime(ffnonbonded)
+    if key not in _nb_atomtypes or _nb_atomtypes[key][0] != mtime:
+        #MS open ffnonbonded, remove HEAVY_H, pass it to NBParser 
+        if bCharmm : 
+            NBParams = NBParser(parse_ffnonbonded_charmm(ffnonbonded),'new',ff)
+        else : 
+            NBParams = NBParser(ffnonbonded,'new',ff)
+        _nb_atomtypes[key] = (mtime, NBParams.atomtypes)
+    atomtypes = _nb_atomtypes[key][1]
+    for atom in chain(r1.atoms,r2.atoms):
 #        print atom.atomtype, atom.name
-        atom.m =  NBParams.atomtypes[atom.atomtype]['mass']
+        atom.m =  atomtypes[atom.atomtype]['mass']
 
 def assign_mass_atp(r1, r2,ffatomtypes):
-    fp = open(ffatomtypes,"r")
-    lst = fp.readlines()
-    lst = kickOutComments(lst,';')
-    fp.close()
-    mass = {}
-    for l in lst:
-        foo = l.split()
-        mass[foo[0]] = float(foo[1])
-    for atom in r1.atoms+r2.atoms:
+    mtime = os.path.getmtime(ffatomtypes)
+    if ffatomtypes not in _atp_masses or _atp_masses[ffatomtypes][0] != mtime:
+        fp = open(ffatomtypes,"r")
+        lst = fp.readlines()
+        lst = kickOutComments(lst,';')
+        fp.close()
+        mass = {}
+        for l in lst:
+            foo = l.split()
+            mass[foo[0]] = float(foo[1])
+        _atp_masses[ffatomtypes] = (mtime, mass)
+    mass = _atp_masses[ffatomtypes][1]
+    for atom in chain(r1.atoms,r2.atoms):
         atom.m = mass[atom.atomtype]
 #        print atom.atomtype, atom.name, atom.m
         
+# A and B names are mostly the same few dozen strings, rename each once
+_gmx_names = {}
+def gmx_atom_name( name ):
+    try:
+        return _gmx_names[name]
+    except KeyError:
+        new = name
+        if new[0].isdigit():
+            new = new[1:]+new[0]
+        if new[0] == 'D' and new[1].isdigit():
+            new = new[0]+new[2:]+new[1]
+        _gmx_names[name] = new
+        return new
+
 def rename_to_gmx( r ):
-    for atom in r1.atoms:
-        if atom.name[0].isdigit():
-            atom.name = atom.name[1:]+atom.name[0]
-        if atom.nameB[0].isdigit():
-            atom.nameB = atom.nameB[1:]+atom.nameB[0]
-        if atom.name[0] == 'D' and atom.name[1].isdigit():
-            atom.name = atom.name[0]+atom.name[2:]+atom.name[1]
-        if atom.nameB[0] == 'D' and atom.nameB[1].isdigit():
-            atom.nameB = atom.nameB[0]+atom.nameB[2:]+atom.nameB[1]
+    for atom in r.atoms:
+        atom.name = gmx_atom_name( atom.name )
+        atom.nameB = gmx_atom_name( atom.nameB )
     res = False
     while not res:
         res = check_double_atom_names( r )
@@ -1262,25 +1214,41 @@ def rename_to_match_library( m, bCharmm=False ):
         if atom.name[0].isdigit():
             atom.name = atom.name[1:]+atom.name[0]
 	if bCharmm:
-	    print atom.name
+	    if bVerbose: print atom.name
 	    if (atom.resname == 'CYS') and (atom.name == 'HG1'):
 		atom.name = 'HG'
             if (atom.resname == 'SER') and (atom.name == 'HG1'):
                 atom.name = 'HG'
-	name_hash[atom.name] = foo
+	# only renamed atoms need to be remembered
+	if atom.name != foo:
+	    name_hash[atom.name] = foo
     return name_hash
 	    
 def rename_back( m, name_hash ):
     for atom in m.atoms:
-        atom.name = name_hash[atom.name]
+        atom.name = name_hash.get( atom.name, atom.name )
 
+# make_predefined_pairs asks for the same few dozen names over and over
+_reformatted_names = {}
 def reformat_atom_name( name ):
-    if name[0].isdigit():
-        name = name[1:]+name[0]
-    return name
+    try:
+        return _reformatted_names[name]
+    except KeyError:
+        new = name
+        if name[0].isdigit():
+            new = name[1:]+name[0]
+        _reformatted_names[name] = new
+        return new
         
 def improps_as_atoms( im, r, use_b = False):
     im_new = []
+    if use_b:
+        # last atom with that B name, as the old scan of r.atoms picked
+        by_nameB = {}
+        for atom in r.atoms:
+            by_nameB[atom.nameB] = atom
+    else:
+        by_name = _name_index( r )
     for ii in im:
         atom_names = ii[:4]
         new_ii = []
@@ -1289,97 +1257,88 @@ def improps_as_atoms( im, r, use_b = False):
                 a = Atom( name = name )
             else:
                 if use_b:
-                    for atom in r.atoms:
-                        if atom.nameB == name:
-                            a = atom
+                    a = by_nameB[ name ]
                 else:
-		    print name 
-                    a = r.fetch( name )[0]
+		    if bVerbose: print name 
+                    a = by_name[ name ]
             new_ii.append( a )
         new_ii.extend( ii[4:] )
         im_new.append( new_ii )
     return im_new
 
 
+# ffnonbonded.itp atomtypes and modification time by path, the file is read
+# again only when it changed since
+_nbitp_atomtypes = {}
+
 def read_nbitp(fn):
-    l = open(fn,'r').readlines()
-    l = kickOutComments(l,';')
-    l = kickOutComments(l,'#')
-    l = readSection(l,'[ atomtypes ]','[')
+    mtime = os.path.getmtime(fn)
+    if fn in _nbitp_atomtypes and _nbitp_atomtypes[fn][0] == mtime:
+        return _nbitp_atomtypes[fn][1]
+    # one pass doing what kickOutComments(';'), kickOutComments('#') and
+    # readSection('[ atomtypes ]') did, keeping only the section lines
+    l = []
+    bSection = False
+    fp = open(fn,'r')
+    for line in fp:
+        line = line.split(';',1)[0].split('#',1)[0].strip()
+        if not line: continue
+        if bSection:
+            if '[' in line: break
+            l.append(line)
+        elif line == '[ atomtypes ]':
+            bSection = True
+    fp.close()
     l = parseList('ssiffsff',l)
     dic = {}
     for entry in l:
         dic[entry[0]]=entry[1:]
+    _nbitp_atomtypes[fn] = (mtime, dic)
     return dic
 
-def write_atp_fnb(fn_atp,fn_nb,r,ff,ffpath):
-    types=[]
-    if os.path.isfile(fn_atp) :
-        ifile=open(fn_atp,'r')
-        for line in ifile:
-            line = line.lstrip()
-            if(not (line.startswith(';') or line.startswith('#') or (line.strip()=='')) ):
-                sp=line.split()
-                types.append(sp[0])
-        ifile.close()
-    if os.path.isfile(fn_atp) :
-        ofile=open(fn_atp,'a')
-    else :
-        ofile=open(fn_atp,'w')
+def defined_types(fp):
+    # first column of every non-comment line of an atp/itp file opened
+    # with 'a+'; leaves fp at the end, ready for appending
+    types=set()
+    fp.seek(0)
+    for line in fp:
+        line = line.lstrip()
+        if not line or line[0] in ';#': continue
+        types.add(line.split(None,1)[0])
+    fp.seek(0,2)
+    return types
 
-    for atom in r.atoms:
-        if atom.atomtype[0:3]=='DUM':
-	    if atom.atomtype not in types:
-                ofile.write("%-6s  %10.6f\n" % (atom.atomtype,atom.m))
-		types.append(atom.atomtype)
-        if atom.atomtypeB[0:3]=='DUM':
-	    if atom.atomtypeB not in types:
-                ofile.write("%-6s  %10.6f\n" % (atom.atomtypeB,atom.mB))
-		types.append(atom.atomtypeB)
-    ofile.close()
-
-    types=[]
-    if os.path.isfile(fn_nb) :
-        ifile=open(fn_nb,'r')
-        for line in ifile:
-            line = line.lstrip()
-            if(not (line.startswith(';') or line.startswith('#') or (line.strip()=='')) ):
-                sp=line.split()
-                types.append(sp[0])
-        ifile.close()
-    if os.path.isfile(fn_nb) :
-        ofile=open(fn_nb,'a')
-    else :
-        ofile=open(fn_nb,'w')
-    print types
+def write_atp_fnb(fn_atp,fn_nb,r,ff,ffpath):
+    # a+ creates the files if they are not there yet
+    atp_file=open(fn_atp,'a+')
+    atp_types = defined_types(atp_file)
+    nb_file=open(fn_nb,'a+')
+    nb_types = defined_types(nb_file)
+    print sorted(nb_types)
 
     # for opls need to extract the atom name
-    ffnamelower = ff.lower()
-    if( 'opls' in ffnamelower):
+    bOPLS = 'opls' in ff.lower()
+    if( bOPLS ):
 	dum_real_name = read_nbitp(os.path.join(ffpath,'ffnonbonded.itp'))
 
+    # dummy types of the A then B state of each atom, to both files at once
     for atom in r.atoms:
-        if atom.atomtype[0:3]=='DUM':
-	    if atom.atomtype not in types:
-		if( 'opls' in ffnamelower):
-		    foo = dum_real_name['opls_'+atom.atomtype.split('_')[2]]
-                    ofile.write("%-13s\t\t%3s\t0\t%4.2f\t   0.0000  A   0.00000e+00 0.00000e+00\n" \
-		     % (atom.atomtype,foo[0],atom.m))
-		else:
-                    ofile.write("%-10s\t0\t%4.2f\t   0.0000  A   0.00000e+00 0.00000e+00\n" \
-		     % (atom.atomtype,atom.m))
-		types.append(atom.atomtype)
-        if atom.atomtypeB[0:3]=='DUM':
-	    if atom.atomtypeB not in types:
-		if( 'opls' in ffnamelower):
-                    foo = dum_real_name['opls_'+atom.atomtypeB.split('_')[2]]
-                    ofile.write("%-13s\t\t%3s\t0\t%4.2f\t   0.0000  A   0.00000e+00 0.00000e+00\n" \
-                     % (atom.atomtypeB,foo[0],atom.mB))
-		else:
-                    ofile.write("%-10s\t0\t%4.2f\t   0.0000  A   0.00000e+00 0.00000e+00\n" \
-		     % (atom.atomtypeB,atom.mB))
-		types.append(atom.atomtypeB)
-    ofile.close()
+        for atype, m in ((atom.atomtype,atom.m), (atom.atomtypeB,atom.mB)):
+            if not atype.startswith('DUM'): continue
+            if atype not in atp_types:
+                atp_file.write("%-6s  %10.6f\n" % (atype,m))
+                atp_types.add(atype)
+            if atype not in nb_types:
+                if( bOPLS ):
+                    foo = dum_real_name['opls_'+atype.split('_')[2]]
+                    nb_file.write("%-13s\t\t%3s\t0\t%4.2f\t   0.0000  A   0.00000e+00 0.00000e+00\n" \
+                     % (atype,foo[0],m))
+                else:
+                    nb_file.write("%-10s\t0\t%4.2f\t   0.0000  A   0.00000e+00 0.00000e+00\n" \
+                     % (atype,m))
+                nb_types.add(atype)
+    atp_file.close()
+    nb_file.close()
 	        
 #    lines=fatp.readlines()
 #    for 
@@ -1401,13 +1360,14 @@ def rename_atoms_charmm(m):
         if atom.name=='HG' and atom.resname=='SER' :
 	    atom.name='1HG'
 
+charmm_resname = {'HIE':'HSE','HID':'HSD','HIP':'HSP','ASH':'ASPP','GLH':'GLUP','LYN':'LSN'}
+
 def rename_res_charmm(m):
-    rename={'HIE':'HSE','HID':'HSD','HIP':'HSP','ASH':'ASPP','GLH':'GLUP','LYN':'LSN'}
     for res in m.residues:
-        if rename.has_key(res.resname):
-	    res.resname=rename[res.resname]
-	    for atom in res.atoms:
-	        atom.resname=res.resname
+        new = charmm_resname.get(res.resname)
+        if new is None: continue
+        # the atoms carry their own copy of the residue name
+        res.set_resname(new)
 
 def get_ff_path( ff ):
     ff_path = None
@@ -1429,389 +1389,320 @@ def get_ff_path( ff ):
 
 
    
-files= [
-   FileOption("-pdb1", "r",["pdb"],"a1.pdb",""),
-   FileOption("-pdb2", "r",["pdb"],"a2.pdb",""),
-   FileOption("-opdb1", "w",["pdb"],"r1.pdb",""),
-   FileOption("-opdb2", "w",["pdb"],"r2.pdb",""),
-   FileOption("-ff", "dir",["ff"],"amber99sbmut", "path to mutation forcefield"),
-#   FileOption("-ff", "r",["rtp"],"aminoacids.rtp",""),
-#   FileOption("-ffnb", "r",["itp"],"ffnonbonded.itp",""),
-#   FileOption("-ffatp", "r",["atp"],"atomtypes.atp",""),
-   FileOption("-fatp", "w",["atp"],"types.atp",""),
-   FileOption("-fnb", "w",["itp"],"fnb.itp",""),
-]
-
-options=[
-   Option( "-ft", "string", "charmm" , "force field type (charmm, amber99sb, amber99sb*-ildn, oplsaa"),
-   Option( "-align", "bool", True, "align side chains"),
-   Option( "-cbeta", "bool", False, "morphing up to Cbeta atom"),
-   Option( "-H2heavy", "bool", True, "allow morphing between hydrogens and heavy atoms"),
-   Option( "-dna", "bool", False, "generate hybrid residue for the DNA nucleotides"),
-   Option( "-rna", "bool", False, "generate hybrid residue for the RNA nucleotides"),
-	]
-
-help_text = ('The script creates hybrid structure (.pdb) and topology database entries (.rtp, .mtp).',
-                'Input: two pdb files aligned on the backbone and path to the force field files.',
-                'Output: hybrid structure, hybrid topology entries as .rtp and .mtp files.',
-                'Also, atomtype and non-bonded parameter files for the introduced dummies are generated.',
-                '',
-                '',
-                'Please cite:',
-                'Vytautas Gapsys, Servaas Michielssens, Daniel Seeliger and Bert L. de Groot.',
-                'Automated Protein Structure and Topology Generation for Alchemical Perturbations.',
-		'J. Comput. Chem. 2015, 36, 348-354. DOI: 10.1002/jcc.23804',
-                '',
-                'Old pmx (pymacs) version:',
-                'Daniel Seeliger and Bert L. de Groot. Protein Thermostability Calculations Using',
-                'Alchemical Free Energy Simulations, Biophysical Journal, 98(10):2309-2316 (2010)',
-                '',
-                '',
-                '',
-            )
-
-#options=[Option("-ff", "string", False ,"aminoacids.rtp")]
-cmdl = Commandline( sys.argv, options = options, 
-		     fileoptions = files,
-                     program_desc = help_text,
-                     check_for_existing_files = False )
-if "charmm" in cmdl['-ft'].lower():
-    bCharmm=True
-else :
-    bCharmm=False
-align = cmdl['-align']
-cbeta = cmdl['-cbeta']
-bH2heavy = cmdl['-H2heavy']
-bDNA = cmdl['-dna']
-bRNA = cmdl['-rna']
-
-ffpath = get_ff_path(cmdl['-ff'])
-
-if bDNA:
-    rtpfile=os.path.join(ffpath,'dna.rtp')
-elif bRNA:
-    rtpfile=os.path.join(ffpath,'rna.rtp')
-else:
-    rtpfile=os.path.join(ffpath,'aminoacids.rtp')
-
-m1 = Model(cmdl['-pdb1'])
-m2 = Model(cmdl['-pdb2'])
-nm1=cmdl['-pdb1']
-nm2=cmdl['-pdb2']
-aa1 = nm1.split('.')[0].split('_')[0]
-aa2 = nm2.split('.')[0].split('_')[0]
-
-rr_name = aa1+'2'+aa2
-if bDNA:
-    rr_name = dna_mutation_naming(aa1,aa2)
-elif bRNA:
-    rr_name = rna_mutation_naming(aa1,aa2)
-elif rr_name in noncanonical_aa.keys():
-    rr_name = noncanonical_aa[rr_name]
-
-m1.get_symbol()
-m2.get_symbol()
-if not (bDNA or bRNA):
-    m1.get_order()
-    m2.get_order()
-m1.rename_atoms()
-m2.rename_atoms()
-if bDNA:
-    rename_atoms_dna(m1)
-    rename_atoms_dna(m2)
-elif bRNA:
-    rename_atoms_rna(m1)
-    rename_atoms_rna(m2)
-
-if bCharmm:
-    rename_atoms_charmm(m1)
-    rename_atoms_charmm(m2)
-    rename_res_charmm(m1)
-    rename_res_charmm(m2)
-
-r1 = m1.residues[0]
-r2 = m2.residues[0]
-
-if not (bDNA or bRNA):
-    r1.get_mol2_types()
-    r2.get_mol2_types()
-r1.get_real_resname()
-r2.get_real_resname()
-if(align):
-    align_sidechains(r1,r2)
-
-r1.resnA = r1.resname[0]+r1.resname[1:].lower()
-r1.resnB = r2.resname[0]+r2.resname[1:].lower()
-
-#r1.write(cmdl['-opdb1'])
-#r2.write(cmdl['-opdb2'])
-
-#rtp = RTPParser('amber99sb-star-ildn.ff/aminoacids.rtp')
-rtp = RTPParser(rtpfile)
-bond_neigh=assign_rtp_entries( r1, rtp )
-assign_rtp_entries( r2, rtp )
-#assign_mass( r1, r2 ,cmdl['-ffnb'],bCharmm,cmdl['-ft'])
-assign_mass_atp( r1, r2 ,os.path.join(ffpath,'atomtypes.atp'))
-
-
-#######################
-resn1_dih = m1.residues[0].resname
-if resn1_dih=='HIS' or resn1_dih=='HID' or resn1_dih=='HIE' or\
-    resn1_dih=='HIP' or resn1_dih=='HISE' or resn1_dih=='HISD' or\
-    resn1_dih=='HISH' or resn1_dih=='HIS1' or resn1_dih=='HSD' or\
-    resn1_dih=='HSE' or resn1_dih=='HSP':
-    resn1_dih = 'HIS'
-elif resn1_dih=='LYN' or resn1_dih=='LYSH' or resn1_dih=='LSN':
-    resn1_dih = 'LYS'
-elif resn1_dih=='ASH' or resn1_dih=='ASPH' or resn1_dih=='ASPP':
-    resn1_dih = 'ASP'
-elif resn1_dih=='GLH' or resn1_dih=='GLUH' or resn1_dih=='GLUP':
-    resn1_dih = 'GLU'
-elif resn1_dih=='CYSH':
-    resn1_dih = 'CYS'
-
-resn2_dih = m2.residues[0].resname
-if resn2_dih=='HIS' or resn2_dih=='HID' or resn2_dih=='HIE' or\
-    resn2_dih=='HIP' or resn2_dih=='HISE' or resn2_dih=='HISD' or\
-    resn2_dih=='HISH' or resn2_dih=='HIS1' or resn2_dih=='HSD' or\
-    resn2_dih=='HSE' or resn2_dih=='HSP':
-    resn2_dih = 'HIS'
-elif resn2_dih=='LYN' or resn2_dih=='LYSH' or resn2_dih=='LSN':
-    resn2_dih = 'LYS'
-elif resn2_dih=='ASH' or resn2_dih=='ASPH' or resn2_dih=='ASPP':
-    resn2_dih = 'ASP'
-elif resn2_dih=='GLH' or resn2_dih=='GLUH' or resn2_dih=='GLUP':
-    resn2_dih = 'GLU'
-elif resn2_dih=='CYSH':
-    resn2_dih = 'CYS'
-#######################
-
-hash1 = {}
-hash2 = {}
-if align and not (bDNA or bRNA):
-    dihed1 = get_dihedrals(resn1_dih)
-    dihed2 = get_dihedrals(resn2_dih)
-    #dihed1 = get_dihedrals(m1.residues[0].resname)
-    #dihed2 = get_dihedrals(m2.residues[0].resname)
-    max_rot = max_rotation(dihed2)
-    max_rot1 = max_rotation(dihed1)
+def main(argv):
+
+    global bVerbose
+
+    files= [
+       FileOption("-pdb1", "r",["pdb"],"a1.pdb",""),
+       FileOption("-pdb2", "r",["pdb"],"a2.pdb",""),
+       FileOption("-opdb1", "w",["pdb"],"r1.pdb",""),
+       FileOption("-opdb2", "w",["pdb"],"r2.pdb",""),
+       FileOption("-ff", "dir",["ff"],"amber99sbmut", "path to mutation forcefield"),
+    #   FileOption("-ff", "r",["rtp"],"aminoacids.rtp",""),
+    #   FileOption("-ffnb", "r",["itp"],"ffnonbonded.itp",""),
+    #   FileOption("-ffatp", "r",["atp"],"atomtypes.atp",""),
+       FileOption("-fatp", "w",["atp"],"types.atp",""),
+       FileOption("-fnb", "w",["itp"],"fnb.itp",""),
+    ]
 
-    for atom in m2.atoms:
-        atom.max_rot = max_rot
-    for atom in m1.atoms:
-        atom.max_rot = max_rot1
-    hash1 = rename_to_match_library(m1, bCharmm)
-    hash2 = rename_to_match_library(m2, bCharmm)
-    do_fit(m1.residues[0],dihed1,m2.residues[0],dihed2)
-    rename_back(m1,hash1)
-    rename_back(m2,hash2)
-
-r1.write(cmdl['-opdb1'])
-r2.write(cmdl['-opdb2'])
-
-assign_branch( r1 )
-assign_branch( r2 )
-
-
-######################################################################################
-############################### selecting pair lists #################################
-######################################################################################
-######## nucleic acids ########
-if bDNA:
-    if (('5' in r1.resname) and ('5' not in r2.resname)) or \
-	(('3' in r1.resname) and ('3' not in r2.resname)) or \
-	(('5' in r2.resname) and ('5' not in r1.resname)) or \
-	(('3' in r2.resname) and ('3' not in r1.resname)):
-	print "Cannot mutate terminal nucleic acid to non-terminal or a terminal of the other end (e.g. 5' to 3')"
-	sys.exit(0)
-    if use_standard_dna_pair_list.has_key( r1.resname ) and \
-	r2.resname in use_standard_dna_pair_list[r1.resname]:
-        print "PURINE <-> PYRIMIDINE"
-        if bCharmm :
-            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_dna_pair_list_charmm)
-        else :
-            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_dna_pair_list)
-    elif use_standard_dna_5term_pair_list.has_key( r1.resname ) and \
-	r2.resname in use_standard_dna_5term_pair_list[r1.resname]:
-        print "PURINE <-> PYRIMIDINE: 5term"
-        if bCharmm :
-            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_dna_5term_pair_list_charmm)
-	else:
-            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_dna_5term_pair_list)
-    elif use_standard_dna_3term_pair_list.has_key( r1.resname ) and \
-	r2.resname in use_standard_dna_3term_pair_list[r1.resname]:
-        print "PURINE <-> PYRIMIDINE: 3term"
-        if bCharmm :
-            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_dna_3term_pair_list_charmm)
-	else:
-            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_dna_3term_pair_list)
-    else:
-	print "PURINE <-> PURINE	PYRIMIDINE <-> PYRIMIDINE"
-        atom_pairs, dummies = make_pairs( r1, r2,bCharmm, bH2heavy, bDNA=True )
-elif bRNA:
-    if (('5' in r1.resname) and ('5' not in r2.resname)) or \
-	(('3' in r1.resname) and ('3' not in r2.resname)) or \
-	(('5' in r2.resname) and ('5' not in r1.resname)) or \
-	(('3' in r2.resname) and ('3' not in r1.resname)):
-	print "Cannot mutate terminal nucleic acid to non-terminal or a terminal of the other end (e.g. 5' to 3')"
-	sys.exit(0)
-    if use_standard_rna_pair_list.has_key( r1.resname ) and \
-	r2.resname in use_standard_rna_pair_list[r1.resname]:
-        print "PURINE <-> PYRIMIDINE"
-#        if bCharmm :
-#            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_rna_pair_list_charmm)
-#        else :
-        atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_rna_pair_list)
-    elif use_standard_rna_5term_pair_list.has_key( r1.resname ) and \
-	r2.resname in use_standard_rna_5term_pair_list[r1.resname]:
-        print "PURINE <-> PYRIMIDINE: 5term"
-#        if bCharmm :
-#            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_rna_5term_pair_list_charmm)
-#	else:
-        atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_rna_5term_pair_list)
-    elif use_standard_rna_3term_pair_list.has_key( r1.resname ) and \
-	r2.resname in use_standard_rna_3term_pair_list[r1.resname]:
-        print "PURINE <-> PYRIMIDINE: 3term"
-#        if bCharmm :
-#            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_rna_3term_pair_list_charmm)
-#	else:
-        atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_rna_3term_pair_list)
-    else:
-	print "PURINE <-> PURINE	PYRIMIDINE <-> PYRIMIDINE"
-        atom_pairs, dummies = make_pairs( r1, r2,bCharmm, bH2heavy, bDNA=False, bRNA=True )
-####### amino acids #########
-#ring-res 2 ring-res
-elif use_standard_pair_list.has_key( r1.resname ) and \
-   r2.resname in use_standard_pair_list[r1.resname]:
-    print "ENTERED STANDARD"
-    if bCharmm :
-	if cbeta:
-	    atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_list_charmmC)
-	else:
-            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_list_charmm)
-    else :
-	if cbeta:
-	    atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_listC)
-	else:
-            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_list)
-#ring-res 2 non-ring-res: T,A,V,I
-elif (r1.resname in res_with_rings and r2.resname in res_diff_Cb ) or \
-     (r2.resname in res_with_rings and r1.resname in res_diff_Cb ):
-    print "ENTERED T,A,V,I"
-    if bCharmm :
-        atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_list_charmmC)
+    options=[
+       Option( "-ft", "string", "charmm" , "force field type (charmm, amber99sb, amber99sb*-ildn, oplsaa"),
+       Option( "-align", "bool", True, "align side chains"),
+       Option( "-cbeta", "bool", False, "morphing up to Cbeta atom"),
+       Option( "-H2heavy", "bool", True, "allow morphing between hydrogens and heavy atoms"),
+       Option( "-dna", "bool", False, "generate hybrid residue for the DNA nucleotides"),
+       Option( "-rna", "bool", False, "generate hybrid residue for the RNA nucleotides"),
+       Option( "-verbose", "bool", False, "print per-atom matching, bond and rotation details"),
+            ]
+
+    help_text = ('The script creates hybrid structure (.pdb) and topology database entries (.rtp, .mtp).',
+                    'Input: two pdb files aligned on the backbone and path to the force field files.',
+                    'Output: hybrid structure, hybrid topology entries as .rtp and .mtp files.',
+                    'Also, atomtype and non-bonded parameter files for the introduced dummies are generated.',
+                    '',
+                    '',
+                    'Please cite:',
+                    'Vytautas Gapsys, Servaas Michielssens, Daniel Seeliger and Bert L. de Groot.',
+                    'Automated Protein Structure and Topology Generation for Alchemical Perturbations.',
+                    'J. Comput. Chem. 2015, 36, 348-354. DOI: 10.1002/jcc.23804',
+                    '',
+                    'Old pmx (pymacs) version:',
+                    'Daniel Seeliger and Bert L. de Groot. Protein Thermostability Calculations Using',
+                    'Alchemical Free Energy Simulations, Biophysical Journal, 98(10):2309-2316 (2010)',
+                    '',
+                    '',
+                    '',
+                )
+
+    #options=[Option("-ff", "string", False ,"aminoacids.rtp")]
+    cmdl = Commandline( argv, options = options, 
+                         fileoptions = files,
+                         program_desc = help_text,
+                         check_for_existing_files = False )
+    if "charmm" in cmdl['-ft'].lower():
+        bCharmm=True
     else :
-        atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_listC)
-#ring-res 2 non-ring-res: G,P
-elif (r1.resname in res_with_rings and r2.resname in res_gly_pro ) or \
-     (r2.resname in res_with_rings and r1.resname in res_gly_pro ):
-    print "ENTERED G,P"
-    if bCharmm :
-        atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_list_charmmD)
-    else :
-        atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_listD)
-#ringed residues by atom names 
-elif merge_by_name_list.has_key( r1.resname ) and r2.resname in merge_by_name_list[r1.resname]:
-    if cbeta:
-        if bCharmm :
-            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_list_charmmC)
-        else :
-            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_listC)
+        bCharmm=False
+    align = cmdl['-align']
+    cbeta = cmdl['-cbeta']
+    bH2heavy = cmdl['-H2heavy']
+    bVerbose = cmdl['-verbose']
+    bDNA = cmdl['-dna']
+    bRNA = cmdl['-rna']
+
+    ffpath = get_ff_path(cmdl['-ff'])
+
+    if bDNA:
+        rtpfile=os.path.join(ffpath,'dna.rtp')
+    elif bRNA:
+        rtpfile=os.path.join(ffpath,'rna.rtp')
     else:
-        print "ENTERED MERGE BY NAMES"
-        atom_pairs, dummies = merge_by_names( r1, r2 ) #make_predefined_pairs( r1, r2, standard_pair_list) 
-#ring-res 2 non-ring-res
-elif r1.resname in res_with_rings or \
-     r2.resname in res_with_rings:
-    print "ENTERED RINGS"
-    if bCharmm :
-	if cbeta:
-	    atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_list_charmmC)
-	else:
-            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_list_charmmB)
-    else :
-	if cbeta:
-	    atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_listC)
-	else:
-            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_listB)
-else:    
-    print "ENTERED SIMPLE"
-    if cbeta:
-	if (r1.resname=='GLY') or (r2.resname=='GLY'):
+        rtpfile=os.path.join(ffpath,'aminoacids.rtp')
+    # fail on an incomplete force field before any structure is parsed
+    for fn in [ rtpfile, os.path.join(ffpath,'atomtypes.atp') ]:
+        if not os.path.isfile(fn):
+            print 'Cannot find force field file: %s' % fn
+            sys.exit(1)
+
+    nm1=cmdl['-pdb1']
+    nm2=cmdl['-pdb2']
+    aa1 = nm1.split('.')[0].split('_')[0]
+    aa2 = nm2.split('.')[0].split('_')[0]
+
+    rr_name = aa1+'2'+aa2
+    if bDNA:
+        rr_name = dna_mutation_naming(aa1,aa2)
+    elif bRNA:
+        rr_name = rna_mutation_naming(aa1,aa2)
+    else:
+        rr_name = noncanonical_aa.get(rr_name, rr_name)
+
+    m1 = Model(cmdl['-pdb1'])
+    m2 = Model(cmdl['-pdb2'])
+    m1.get_symbol()
+    m2.get_symbol()
+    if not (bDNA or bRNA):
+        m1.get_order()
+        m2.get_order()
+    m1.rename_atoms()
+    m2.rename_atoms()
+    if bDNA:
+        rename_atoms_dna(m1)
+        rename_atoms_dna(m2)
+    elif bRNA:
+        rename_atoms_rna(m1)
+        rename_atoms_rna(m2)
+
+    if bCharmm:
+        rename_atoms_charmm(m1)
+        rename_atoms_charmm(m2)
+        rename_res_charmm(m1)
+        rename_res_charmm(m2)
+
+    r1 = m1.residues[0]
+    r2 = m2.residues[0]
+
+    if not (bDNA or bRNA):
+        r1.get_mol2_types()
+        r2.get_mol2_types()
+    r1.get_real_resname()
+    r2.get_real_resname()
+    if(align):
+        align_sidechains(r1,r2)
+
+    r1.resnA = r1.resname[0]+r1.resname[1:].lower()
+    r1.resnB = r2.resname[0]+r2.resname[1:].lower()
+
+    #r1.write(cmdl['-opdb1'])
+    #r2.write(cmdl['-opdb2'])
+
+    #rtp = RTPParser('amber99sb-star-ildn.ff/aminoacids.rtp')
+    rtp = RTPParser(rtpfile)
+    bond_neigh=assign_rtp_entries( r1, rtp )
+    assign_rtp_entries( r2, rtp )
+    #assign_mass( r1, r2 ,cmdl['-ffnb'],bCharmm,cmdl['-ft'])
+    assign_mass_atp( r1, r2 ,os.path.join(ffpath,'atomtypes.atp'))
+
+
+    #######################
+    resn1_dih = r1.resname
+    resn1_dih = dihedral_resname.get( resn1_dih, resn1_dih )
+    resn2_dih = r2.resname
+    resn2_dih = dihedral_resname.get( resn2_dih, resn2_dih )
+    #######################
+
+    hash1 = {}
+    hash2 = {}
+    if align and not (bDNA or bRNA):
+        dihed1 = get_dihedrals(resn1_dih)
+        dihed2 = get_dihedrals(resn2_dih)
+        #dihed1 = get_dihedrals(m1.residues[0].resname)
+        #dihed2 = get_dihedrals(m2.residues[0].resname)
+        max_rot = max_rotation(dihed2)
+        max_rot1 = max_rotation(dihed1)
+
+        for atom in m2.atoms:
+            atom.max_rot = max_rot
+        for atom in m1.atoms:
+            atom.max_rot = max_rot1
+        hash1 = rename_to_match_library(m1, bCharmm)
+        hash2 = rename_to_match_library(m2, bCharmm)
+        do_fit(r1,dihed1,r2,dihed2)
+        rename_back(m1,hash1)
+        rename_back(m2,hash2)
+
+    r1.write(cmdl['-opdb1'])
+    r2.write(cmdl['-opdb2'])
+
+    assign_branch( r1 )
+    assign_branch( r2 )
+
+
+    ######################################################################################
+    ############################### selecting pair lists #################################
+    ######################################################################################
+    ######## nucleic acids ########
+    if bDNA:
+        if (('5' in r1.resname) and ('5' not in r2.resname)) or \
+            (('3' in r1.resname) and ('3' not in r2.resname)) or \
+            (('5' in r2.resname) and ('5' not in r1.resname)) or \
+            (('3' in r2.resname) and ('3' not in r1.resname)):
+            print "Cannot mutate terminal nucleic acid to non-terminal or a terminal of the other end (e.g. 5' to 3')"
+            sys.exit(0)
+        if r2.resname in use_standard_dna_pair_list.get( r1.resname, () ):
+            print "PURINE <-> PYRIMIDINE"
             if bCharmm :
-                atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_list_charmmD)
+                atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_dna_pair_list_charmm)
             else :
-                atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_listD)
-	else:
+                atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_dna_pair_list)
+        elif r2.resname in use_standard_dna_5term_pair_list.get( r1.resname, () ):
+            print "PURINE <-> PYRIMIDINE: 5term"
             if bCharmm :
-                atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_list_charmmC)
-            else :
-                atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_pair_listC)
+                atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_dna_5term_pair_list_charmm)
+            else:
+                atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_dna_5term_pair_list)
+        elif r2.resname in use_standard_dna_3term_pair_list.get( r1.resname, () ):
+            print "PURINE <-> PYRIMIDINE: 3term"
+            if bCharmm :
+                atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_dna_3term_pair_list_charmm)
+            else:
+                atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_dna_3term_pair_list)
+        else:
+            print "PURINE <-> PURINE	PYRIMIDINE <-> PYRIMIDINE"
+            atom_pairs, dummies = make_pairs( r1, r2,bCharmm, bH2heavy, bDNA=True )
+    elif bRNA:
+        if (('5' in r1.resname) and ('5' not in r2.resname)) or \
+            (('3' in r1.resname) and ('3' not in r2.resname)) or \
+            (('5' in r2.resname) and ('5' not in r1.resname)) or \
+            (('3' in r2.resname) and ('3' not in r1.resname)):
+            print "Cannot mutate terminal nucleic acid to non-terminal or a terminal of the other end (e.g. 5' to 3')"
+            sys.exit(0)
+        if r2.resname in use_standard_rna_pair_list.get( r1.resname, () ):
+            print "PURINE <-> PYRIMIDINE"
+    #        if bCharmm :
+    #            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_rna_pair_list_charmm)
+    #        else :
+            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_rna_pair_list)
+        elif r2.resname in use_standard_rna_5term_pair_list.get( r1.resname, () ):
+            print "PURINE <-> PYRIMIDINE: 5term"
+    #        if bCharmm :
+    #            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_rna_5term_pair_list_charmm)
+    #	else:
+            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_rna_5term_pair_list)
+        elif r2.resname in use_standard_rna_3term_pair_list.get( r1.resname, () ):
+            print "PURINE <-> PYRIMIDINE: 3term"
+    #        if bCharmm :
+    #            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_rna_3term_pair_list_charmm)
+    #	else:
+            atom_pairs, dummies = make_predefined_pairs( r1, r2, standard_rna_3term_pair_list)
+        else:
+            print "PURINE <-> PURINE	PYRIMIDINE <-> PYRIMIDINE"
+            atom_pairs, dummies = make_pairs( r1, r2,bCharmm, bH2heavy, bDNA=False, bRNA=True )
+    ####### amino acids #########
     else:
-        atom_pairs, dummies = make_pairs( r1, r2,bCharmm, bH2heavy )
-######################################################################################
-######################################################################################
-######################################################################################
-#sys.exit(0)
+        category = aa_pair_category( r1.resname, r2.resname )
+        if aa_pair_messages.has_key( category ):
+            print aa_pair_messages[category]
+        if aa_pair_lists.has_key( (category, cbeta) ):
+            pair_list, pair_list_charmm = aa_pair_lists[(category, cbeta)]
+            if bCharmm :
+                atom_pairs, dummies = make_predefined_pairs( r1, r2, pair_list_charmm)
+            else :
+                atom_pairs, dummies = make_predefined_pairs( r1, r2, pair_list)
+        elif category == 'merge':
+            print "ENTERED MERGE BY NAMES"
+            atom_pairs, dummies = merge_by_names( r1, r2 ) #make_predefined_pairs( r1, r2, standard_pair_list) 
+        else:
+            atom_pairs, dummies = make_pairs( r1, r2,bCharmm, bH2heavy )
+    ######################################################################################
+    ######################################################################################
+    ######################################################################################
+    #sys.exit(0)
 
 
 
-merge_molecules( r1, dummies )
-make_bstate_dummies( r1 )
+    merge_molecules( r1, dummies )
+    make_bstate_dummies( r1 )
 
-write_atp_fnb(cmdl["-fatp"],cmdl["-fnb"],r1,cmdl['-ft'],ffpath)
-abdic, badic = make_transition_dics( atom_pairs, r1)
+    write_atp_fnb(cmdl["-fatp"],cmdl["-fnb"],r1,cmdl['-ft'],ffpath)
+    abdic, badic = make_transition_dics( atom_pairs, r1)
 
-update_bond_lists( r1, badic )
+    update_bond_lists( r1, badic )
 
-# VG #
-# CMAP for charmm #
+    # VG #
+    # CMAP for charmm #
 
-# VG #
-# dihedrals are necessary for ILDN #
-dih_1 = rtp[r1.resname]['diheds']
-dih_2 = rtp[r2.resname]['diheds']
+    # VG #
+    # dihedrals are necessary for ILDN #
+    rtp_1 = rtp[r1.resname]
+    rtp_2 = rtp[r2.resname]
+    dih_1 = rtp_1['diheds']
+    dih_2 = rtp_2['diheds']
 
-dih1 = improps_as_atoms( dih_1, r1) #its alright, can use improper function
-dih2 = improps_as_atoms( dih_2, r1, use_b = True)
+    dih1 = improps_as_atoms( dih_1, r1) #its alright, can use improper function
+    dih2 = improps_as_atoms( dih_2, r1, use_b = True)
 
-# VG #
-# here go impropers #
-im_1 = rtp[r1.resname]['improps']
-im_2 = rtp[r2.resname]['improps']
+    # VG #
+    # here go impropers #
+    im_1 = rtp_1['improps']
+    im_2 = rtp_2['improps']
 
-im1 = improps_as_atoms( im_1, r1)
-im2 = improps_as_atoms( im_2, r1, use_b = True)
-#for x in dih1:
-#    print x
-## print
-## for x in im2:
-##     print x
+    im1 = improps_as_atoms( im_1, r1)
+    im2 = improps_as_atoms( im_2, r1, use_b = True)
+    #for x in dih1:
+    #    print x
+    ## print
+    ## for x in im2:
+    ##     print x
 
-# cmap #
-cmap=[]
-if bCharmm :
-    cmap=rtp[r1.resname]['cmap']
+    # cmap #
+    cmap=[]
+    if bCharmm :
+        cmap=rtp_1['cmap']
+
+    # dihedrals #
+    dihi_list = generate_dihedral_entries(dih1, dih2, r1, atom_pairs)
 
-# dihedrals #
-dihi_list = generate_dihedral_entries(dih1, dih2, r1, atom_pairs)
+    # impropers #
+    ii_list = generate_improp_entries(im1, im2, r1)
 
-# impropers #
-ii_list = generate_improp_entries(im1, im2, r1)
+    if not (bDNA or bRNA):
+        rot = make_rotations(r1,resn1_dih,resn2_dih)
 
-if not (bDNA or bRNA):
-    rot = make_rotations(r1,resn1_dih,resn2_dih)
+    r1.set_resname( rr_name )
+    rename_to_gmx( r1 )
 
-r1.set_resname( rr_name )
-rename_to_gmx( r1 )
+    rtp_out = open(rr_name+'.rtp','w')
+    write_rtp(rtp_out, r1,ii_list, dihi_list, bond_neigh,cmap)
+    r1.write(rr_name+'.pdb')
+    mtp_out = open(rr_name+'.mtp','w')
 
-rtp_out = open(rr_name+'.rtp','w')
-write_rtp(rtp_out, r1,ii_list, dihi_list, bond_neigh,cmap)
-r1.write(rr_name+'.pdb')
-mtp_out = open(rr_name+'.mtp','w')
+    if bDNA or bRNA:
+        write_mtp(mtp_out, r1, ii_list, False, dihi_list)     
+    else:
+        write_mtp(mtp_out, r1, ii_list, rot, dihi_list)     
 
-if bDNA or bRNA:
-    write_mtp(mtp_out, r1, ii_list, False, dihi_list)     
-else:
-    write_mtp(mtp_out, r1, ii_list, rot, dihi_list)     
 
+if __name__ == '__main__':
+    main(sys.argv)
@@ -40,7 +40,7 @@ dna_res = ['DA','DG','DT','DC']
 rna_res = ['RA','RU','RC','RG']
 
 def chain_type(ch):
-    if ch.residues[0].resname in library._one_letter.keys():
+    if ch.residues[0].resname in library._one_letter:
         return 'pep'
     elif ch.residues[0].resname in dna_res:
         return 'dna'
@@ -177,9 +177,9 @@ for chain in model.chains:
     first = chain.residues[0]      # first residue
     last = chain.residues[-1]      # last residue
     if ct == 'pep':
-        if first.resname in library._one_letter.keys():
+        if first.resname in library._one_letter:
             first.set_resname('N'+first.resname) # rename e.g. ALA to NALA
-        if last.resname in library._one_letter.keys():
+        if last.resname in library._one_letter:
             if last.resname == 'CYS2':
                 last.set_resname('CCYX')   # rename e.g. ARG to CARG
             else:
@@ -190,7 +190,7 @@ for chain in model.chains:
             idx = chain.residues.index(last)-1
             while not found:
                 r = chain.residues[idx]
-                if r.resname in library._one_letter.keys():
+                if r.resname in library._one_letter:
                     if r.resname == 'CYS2':
                         r.set_resname('CCYX')
                     else: